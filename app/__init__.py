@@ -1,12 +1,26 @@
 __author__ = 'minhtule'
 
+import os
+from multiprocessing import cpu_count
 from flask import Flask
 
 app = Flask(__name__)
 
 STATIC_PATH = './app/static'
 
+# Number of worker processes used to render the frames of a video.
+# Set it to 1 to render serially in the request's process when debugging.
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', cpu_count()))
+
+# Number of /generate_video jobs rendered at the same time. Further jobs wait in a queue.
+RENDER_JOB_CONCURRENCY = int(os.environ.get('RENDER_JOB_CONCURRENCY', 1))
+
 import cube
 import process
 import controllers
 import cut_image
+
+from textures import warm_up_textures
+
+# Decode the bundled textures now rather than during the first requests
+warm_up_textures(cube.CUBE_TEXTURE_PATHS + cut_image.ROOM_IMAGE_PATHS)
@@ -4,6 +4,51 @@ import cv2.cv as cv
 import cv2 as cv2
 from helper import *
 from surface import Surface, Line2D
+from metrics import timed, collect_iteration
+from encoders import open_encoder
+
+
+# Ways of combining the projected surfaces into a frame
+COMPOSITE_OR = 'or'        # bitwise OR of the projected images. Fast but wrong where surfaces overlap
+COMPOSITE_DEPTH = 'depth'  # per-pixel Z-buffer, the closest surface wins
+
+# Surfaces whose projection covers less than this many pixels are not drawn
+MIN_PROJECTED_AREA = 1.0
+
+# Whether textures are warped from the level of their mipmap matching their size on screen
+MIPMAPPING = True
+
+
+class RenderTarget(object):
+    """
+    The color and depth buffers a camera renders a frame into, along with scratch
+    space for the projected surfaces. A render target is meant to be reused from
+    frame to frame so that steady-state rendering doesn't allocate any large array.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.image = np.zeros((height, width, 3), np.uint8)
+        self.depth = np.empty((height, width), np.float32)
+        # Scratch space is kept flat so that any (height, width) prefix is contiguous
+        self._warp_buffer = np.empty(height * width * 3, np.uint8)
+        self._depth_buffer = np.empty(height * width, np.float32)
+        self._mask_buffers = np.empty((2, height * width), bool)
+
+    def clear(self, depth=False):
+        self.image.fill(0)
+        if depth:
+            self.depth.fill(np.inf)
+
+    def warp_buffer(self, width, height):
+        return self._warp_buffer[:height * width * 3].reshape(height, width, 3)
+
+    def depth_buffer(self, width, height):
+        return self._depth_buffer[:height * width].reshape(height, width)
+
+    def mask_buffer(self, width, height, index=0):
+        return self._mask_buffers[index, :height * width].reshape(height, width)
 
 
 # For this project, our world coordinate is defined as following
@@ -21,12 +66,18 @@ class Camera(object):
         self.v0 = kwargs['v0'] if 'v0' in kwargs else 0.0  # image center vertical offset
         self.bu = kwargs['bu'] if 'bu' in kwargs else 1.0  # pixel scaling factor in horizontal direction
         self.bv = kwargs['bv'] if 'bv' in kwargs else 1.0  # pixel scaling factor in vertical direction
+        self.compositing = kwargs['compositing'] if 'compositing' in kwargs else COMPOSITE_OR
+        self.min_projected_area = kwargs['min_projected_area'] if 'min_projected_area' in kwargs \
+            else MIN_PROJECTED_AREA
+        self.mipmapping = kwargs['mipmapping'] if 'mipmapping' in kwargs else MIPMAPPING
         self.position = np.array([0.0, 0.0, 0.0])  # starting at the world coordinate system's origin
 
         self.orientation = np.array([[1.0, 0.0, 0.0],   # camera's horizontal axis
                                      [0.0, 0.0, -1.0],  # camera's vertical axis
                                      [0.0, 1.0, 0.0]])  # camera's optical axis
 
+        self._ray_grid = None
+
     def horizontal_axis(self):
         return self.orientation[0]
 
@@ -47,38 +98,87 @@ class Camera(object):
             of the camera
 
         """
-        dist = scene_point - self.position
-        d = np.dot(dist, self.optical_axis())
-        if d == 0:
-            # to avoid explosion!!!
-            d = np.finfo(np.float32).eps
+        u, v = self.project_points(np.array([scene_point]))[0]
+        return u, v
+
+    def project_points(self, scene_points, positions=None, orientations=None):
+        """
+        Project many scene points at once using perspective projection, optionally
+        for a whole stack of camera poses.
+
+        :param
+            scene_points (np.array of shape (N, 3)): the 3D-coordinates of the scene points
+            positions (np.array of shape (F, 3)): (optional) the camera positions
+            orientations (np.array of shape (F, 3, 3)): (optional) the camera orientations
+        :return
+            np.array of shape (N, 2), or (F, N, 2) when the poses are given: the 2D-coordinates
+            of the image points with respect to the center of the camera
+
+        """
+        scene_points = np.asarray(scene_points, np.float64)
+        if positions is None:
+            # Coordinates of the points w.r.t. the camera's coordinate system
+            points = (scene_points - self.position).dot(self.orientation.T)
+        else:
+            dist = scene_points[np.newaxis, :, :] - np.asarray(positions, np.float64)[:, np.newaxis, :]
+            points = np.einsum('fnk,fjk->fnj', dist, np.asarray(orientations, np.float64))
+
+        d = points[..., 2]
+        # to avoid explosion!!!
+        d = np.where(d == 0, np.finfo(np.float32).eps, d)
+
+        projected_points = np.empty(points.shape[:-1] + (2,))
+        projected_points[..., 0] = self.u0 + self.focal * points[..., 0] * self.bu / d
+        projected_points[..., 1] = self.v0 + self.focal * points[..., 1] * self.bv / d
+        return np.clip(projected_points, -MAX_FLOAT32_COORD, MAX_FLOAT32_COORD, out=projected_points)
+
+    def clipping_surface(self, surface, distances=None):
+        """
+        :param distances: (optional) the distances from the surface's 4 corners to the image plane
+        :return: the surface's image with the part behind the camera blacked out,
+        or None if the surface is completely behind the camera
+        """
+        region = self.clipping_region(surface, distances)
+        if region is None:
+            return None
+
+        height, width, _ = surface.image.shape
+        x1, y1, x2, y2 = region
+        if (x1, y1, x2, y2) == (0, 0, width, height):
+            return surface.image
 
-        u = self.u0 + self.focal * np.dot(dist, self.horizontal_axis()) * self.bu / d
-        v = self.v0 + self.focal * np.dot(dist, self.vertical_axis()) * self.bv / d
-        return box_coord(u), box_coord(v)
+        clipped_image = np.zeros_like(surface.image)
+        clipped_image[y1:y2, x1:x2] = surface.image[y1:y2, x1:x2]
 
-    def clipping_surface(self, surface):
-        top_left_dist = self.distance_to_image_plane(surface.top_left_corner3d())
-        top_right_dist = self.distance_to_image_plane(surface.top_right_corner3d())
-        bottom_right_dist = self.distance_to_image_plane(surface.bottom_right_corner3d())
-        bottom_left_dist = self.distance_to_image_plane(surface.bottom_left_corner3d())
+        return clipped_image
 
-        distances = [top_left_dist, top_right_dist, bottom_right_dist, bottom_left_dist]
+    def clipping_region(self, surface, distances=None):
+        """
+        :param distances: (optional) the distances from the surface's 4 corners to the image plane
+        :return: (x1, y1, x2, y2) the rectangle of the surface's image in front of the camera,
+        or None if the surface is completely behind the camera
+        """
+        if distances is None:
+            distances = [self.distance_to_image_plane(surface.top_left_corner3d()),
+                         self.distance_to_image_plane(surface.top_right_corner3d()),
+                         self.distance_to_image_plane(surface.bottom_right_corner3d()),
+                         self.distance_to_image_plane(surface.bottom_left_corner3d())]
+        top_left_dist, top_right_dist, bottom_right_dist, bottom_left_dist = distances
 
         num_of_positive_distances = len(filter(lambda dist: dist > 0, distances))
         if num_of_positive_distances == 0:
             # The surface is completely behind the camera
             return None
 
+        height, width, _ = surface.image.shape
         if num_of_positive_distances == 4:
             # The surface is completely in front of the camera
-            return surface.image
+            return 0, 0, width, height
 
         # The surface is partially in front and we need to clip the surface.
         # For simplicity, we assume that the surface go out of view in a
         # "nice" manner. That means we can slice the visible part as a rectangle
         # not any other polygon.
-        height, width, _ = surface.image.shape
         top_x1, top_x2 = self._find_cut_region(top_left_dist, top_right_dist, width)
         bottom_x1, bottom_x2 = self._find_cut_region(bottom_left_dist, bottom_right_dist, width)
         x1 = min(top_x1, bottom_x1)
@@ -88,10 +188,7 @@ class Camera(object):
         y1 = min(left_y1, right_y1)
         y2 = max(left_y2, right_y2)
 
-        clipped_image = np.zeros_like(surface.image)
-        clipped_image[y1:y2, x1:x2] = surface.image[y1:y2, x1:x2]
-
-        return clipped_image
+        return int(x1), int(y1), int(x2), int(y2)
 
     def _find_cut_region(self, left_dist, right_dist, length):
         """
@@ -114,58 +211,212 @@ class Camera(object):
         distance_wrt_image_plane = np.dot(distance_wrt_camera, self.optical_axis())
         return distance_wrt_image_plane
 
-    def project_surface(self, surface):
+    def project_surface(self, surface, projected_points=None):
+        """
+        :param projected_points: (optional) array of shape (4, 2) of the surface's corners
+        already projected by project_points
+        :return: the projected image of the size of the camera's image,
+        or None if the surface is not visible
+        """
+        projected_image, offset = self.project_surface_region(surface, projected_points)
+        if projected_image is None:
+            return None
+
+        x, y = offset
+        height, width, _ = projected_image.shape
+        result_image = np.zeros((self.height, self.width, 3), np.uint8)
+        result_image[y:y + height, x:x + width] = projected_image
+        return result_image
+
+    def project_surface_region(self, surface, projected_points=None, target=None):
+        """
+        Same as project_surface but only returns the part of the projected image
+        covered by the surface.
+
+        :param target: (optional) the RenderTarget whose scratch space receives the projected image
+
+        :return: (projected_image, (x, y)) where (x, y) is the position of the
+        projected image's top left corner in the camera's image, or (None, None)
+        if the surface is not visible
+        """
         camera_position_wrt_surface = self.position - surface.edge_points3d[0]
         if np.dot(surface.normal, camera_position_wrt_surface) <= 0:
             # camera is behind the surface
-            # return None, None
-            return None
-
-        projected_points = []
-        for point3D in surface.edge_points3d:
-            projected_point_wrt_center = self.point_projection(point3D)
-            projected_point = (projected_point_wrt_center[0] + self.half_width,
-                               projected_point_wrt_center[1] + self.half_height)
-            projected_points.append(projected_point)
+            return None, None
 
-        projected_points = np.float32(projected_points)
+        if projected_points is None:
+            projected_points = self.project_points(surface.edge_points3d)
+        projected_points = np.float32(projected_points + (self.half_width, self.half_height))
         transform_matrix = cv2.getPerspectiveTransform(surface.edge_points2d, projected_points)
+        return self.warp_surface(surface, transform_matrix, target=target)
 
-        surface_image = self.clipping_surface(surface)
-        if surface_image is None:
+    @timed('warp_surface')
+    def warp_surface(self, surface, transform_matrix, distances=None, target=None):
+        """
+        Warp the visible part of the surface's texture onto the image plane. Only
+        the bounding box of the projected surface within the camera's image is
+        warped, and nothing is warped for surfaces that are off-screen or smaller
+        than min_projected_area. Distant surfaces are warped from a smaller level
+        of their mipmap if mipmapping is on.
+
+        :param transform_matrix: the homography from the texture to the image plane
+        :param distances: (optional) the distances from the surface's 4 corners to the image plane
+        :param target: (optional) the RenderTarget whose scratch space receives the projected image.
+        The projected image is then only valid until the next surface is warped into it
+        :return: (projected_image, (x, y)) as in project_surface_region
+        """
+        region = self.clipping_region(surface, distances)
+        if region is None:
             # The entire surface is out of view!
+            return None, None
+
+        x1, y1, x2, y2 = region
+        texture = surface.image
+        texture_height, texture_width, _ = texture.shape
+        if (x1, y1, x2, y2) == (0, 0, texture_width, texture_height):
+            corners = self._projected_corners(surface, transform_matrix)
+            bounding_box = self._projected_bounding_box(corners)
+            if bounding_box is None:
+                return None, None
+            if self.mipmapping:
+                texture, level = surface.mipmap(self._mipmap_level(surface, corners))
+                if level > 0:
+                    # Texture coordinates of the level are 2^level times smaller
+                    transform_matrix = transform_matrix.dot(np.diag([2.0 ** level, 2.0 ** level, 1]))
+        else:
+            # Corners behind the camera don't project to anything meaningful,
+            # so a clipped surface may cover anywhere on the image.
+            bounding_box = 0, 0, self.width, self.height
+            texture = texture[y1:y2, x1:x2]
+            transform_matrix = transform_matrix.dot(np.array([[1, 0, x1], [0, 1, y1], [0, 0, 1]]))
+
+        # Warp the visible part of the texture into the bounding box only
+        left, top, right, bottom = bounding_box
+        transform_matrix = np.array([[1, 0, -left], [0, 1, -top], [0, 0, 1]]).dot(transform_matrix)
+        size = (right - left, bottom - top)
+        buffer = target.warp_buffer(*size) if target is not None else None
+        projected_image = cv2.warpPerspective(texture, transform_matrix, size, dst=buffer)
+        return projected_image, (left, top)
+
+    def _projected_corners(self, surface, transform_matrix):
+        """
+        :return: array of shape (4, 2) of the surface's corners on the image plane,
+        or None if the surface is seen edge-on and its projection is degenerate
+        """
+        corners = np.hstack([surface.edge_points2d, np.ones((4, 1), np.float32)]).dot(np.transpose(transform_matrix))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corners = corners[:, :2] / corners[:, 2:]
+        if not np.isfinite(corners).all():
             return None
+        return corners
 
-        projected_image = cv2.warpPerspective(surface_image, transform_matrix, (self.width, self.height))
+    def _mipmap_level(self, surface, corners):
+        """
+        :param corners: the surface's corners on the image plane
+        :return: the mipmap level whose texels are about the size of a pixel along
+        the least shrunk edge of the surface, so no part of it is blurred
+        """
+        projected_edges = corners[[1, 2, 3, 0]] - corners
+        projected_lengths = np.sqrt(projected_edges[:, 0] ** 2 + projected_edges[:, 1] ** 2)
+        texels_per_pixel = (surface.edge_lengths2d / np.maximum(projected_lengths, 1e-6)).min()
+        if texels_per_pixel < 2:
+            return 0
+        return int(floor(log(texels_per_pixel, 2)))
+
+    def _projected_bounding_box(self, corners):
+        """
+        :param corners: the surface's corners on the image plane, see _projected_corners
+        :return: (left, top, right, bottom) the bounding box of the projected surface
+        within the camera's image, or None if it is off-screen, too small or degenerate
+        """
+        if corners is None:
+            return None
+        x, y = corners[:, 0], corners[:, 1]
 
-        # image_depth = self.__get_projected_image_depth(projected_image, surface)
+        # Shoelace formula
+        previous = [3, 0, 1, 2]
+        area = 0.5 * abs(np.dot(x, y[previous]) - np.dot(y, x[previous]))
+        if area < self.min_projected_area:
+            return None
 
-        # return projected_image, image_depth
-        return projected_image
+        left = max(int(floor(x.min())), 0)
+        top = max(int(floor(y.min())), 0)
+        right = min(int(ceil(x.max())) + 1, self.width)
+        bottom = min(int(ceil(y.max())) + 1, self.height)
+        if left >= right or top >= bottom:
+            return None
+        return left, top, right, bottom
 
-    def project_surfaces(self, surfaces):
-        result_image = np.zeros((self.height, self.width, 3), np.uint8)
-        result_depth = np.ones((self.height, self.width)) * np.inf
-
-        for surface in surfaces:
-            projected_image = self.project_surface(surface)
-            # projected_image, image_depth = self.project_surface(surface)
-            if projected_image is not None:
-                result_image = cv2.bitwise_or(result_image, projected_image)
-                # result_image, result_depth = self.__overlay_images(result_image, result_depth,
-                #                                                    projected_image, image_depth)
+    def project_surfaces(self, surfaces, target=None):
+        """
+        :param target: (optional) the RenderTarget to render into. By default a new frame is allocated
+        :return: the frame. When rendering into a target, the frame is the target's image
+        and is overwritten by the next frame rendered into it
+        """
+        if target is None:
+            target = RenderTarget(self.width, self.height)
+        if not surfaces:
+            return self.composite_surfaces([], target)
+
+        # Project the corners of all the surfaces at once
+        corners = self.project_points(np.concatenate([surface.edge_points3d for surface in surfaces]))
+        return self.composite_surfaces(
+            ((surface,) + self.project_surface_region(surface, corners[4 * index:4 * index + 4], target)
+             for index, surface in enumerate(surfaces)),
+            target)
+
+    def composite_surfaces(self, projections, target):
+        """
+        Combine projected surfaces into a single frame according to the camera's compositing mode.
+
+        :param projections: iterable of (surface, projected_image, (x, y)) as returned by
+        project_surface_region. projected_image is None if the surface is not visible
+        :param target: the RenderTarget to render into. It is cleared first
+        :return: the frame, i.e. the target's image
+        """
+        depth_compositing = self.compositing == COMPOSITE_DEPTH
+        target.clear(depth=depth_compositing)
+        result_image, result_depth = target.image, target.depth
+
+        for surface, projected_image, offset in projections:
+            if projected_image is None:
+                continue
+            x, y = offset
+            height, width, _ = projected_image.shape
+            region = np.s_[y:y + height, x:x + width]
+            if depth_compositing:
+                image_depth = self.__get_projected_image_depth(projected_image, surface, offset, target)
+                self.__overlay_images(result_image[region], result_depth[region], projected_image, image_depth,
+                                      target.mask_buffer(width, height))
+            else:
+                np.bitwise_or(result_image[region], projected_image, out=result_image[region])
         return result_image
 
-    def project_polyhedron(self, polyhedron):
-        return self.project_surfaces(polyhedron.surfaces)
+    def project_polyhedron(self, polyhedron, target=None):
+        return self.project_surfaces(polyhedron.surfaces, target)
 
-    def project_space(self, space):
-        surfaces = []
-        for model in space.models:
-            surfaces.extend(model.surfaces)
-        return self.project_surfaces(surfaces)
+    @timed('project_space')
+    def project_space(self, space, target=None):
+        return self.project_surfaces(space.surfaces(), target)
 
-    def __get_projected_image_depth(self, projected_image, surface):
+    def ray_grid(self):
+        """
+        :return: array of shape (height, width, 3). The unit vector from the camera
+        through each pixel of the image, w.r.t. the camera's coordinate system.
+        It only depends on the camera's intrinsics so it's computed once.
+        """
+        if self._ray_grid is None:
+            u = (np.arange(self.width, dtype=np.float32) - self.half_width - self.u0) / self.bu
+            v = (np.arange(self.height, dtype=np.float32) - self.half_height - self.v0) / self.bv
+            rays = np.empty((self.height, self.width, 3), np.float32)
+            rays[:, :, 0] = u[np.newaxis, :]
+            rays[:, :, 1] = v[:, np.newaxis]
+            rays[:, :, 2] = self.focal
+            rays /= np.sqrt((rays ** 2).sum(axis=2))[:, :, np.newaxis]
+            self._ray_grid = rays
+        return self._ray_grid
+
+    def __get_projected_image_depth(self, projected_image, surface, offset, target):
         """
         Let p is a point on the surface. We're using the 1st point on the surface
             n is the normal vector of the surface
@@ -176,29 +427,43 @@ class Camera(object):
         where . is the dot product of 2 vectors
 
         Note: all vectors are w.r.t. the camera's coordinate system.
+        Pixels not covered by the projected image have an infinite depth.
+
+        :param offset: position of the projected image's top left corner in the camera's image
+        :param target: the RenderTarget whose scratch space receives the depth
         """
-        image_depth = np.ones((self.height, self.width)) * np.inf
         p = self.orientation.dot(surface.edge_points3d[0] - self.position)
-        n = self.orientation.dot(surface.normal)
+        n = self.orientation.dot(surface.normal).astype(np.float32)
         t = p.dot(n)
 
-        for i in xrange(self.height):
-            for j in xrange(self.width):
-                if not np.allclose(projected_image[i, j], 0):
-                    d = np.array([j - self.half_width, i - self.half_height, self.focal])
-                    d /= np.linalg.norm(d)
-                    image_depth[i, j] = t / d.dot(n)
-
+        x, y = offset
+        height, width, _ = projected_image.shape
+        rays = self.ray_grid()[y:y + height, x:x + width]
+        image_depth = target.depth_buffer(width, height)
+        np.dot(rays, n, out=image_depth)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.divide(t, image_depth, out=image_depth)
+
+        # Only pixels covered by the surface, in front of the camera, have a depth
+        hidden = target.mask_buffer(width, height, 0)
+        in_front = target.mask_buffer(width, height, 1)
+        projected_image.any(axis=2, out=hidden)
+        with np.errstate(invalid='ignore'):
+            np.greater(image_depth, 0, out=in_front)
+        np.logical_and(hidden, in_front, out=hidden)
+        np.logical_not(hidden, out=hidden)
+        np.copyto(image_depth, np.inf, where=hidden)
         return image_depth
 
-    def __overlay_images(self, image1, image_depth1, image2, image_depth2):
-        height, width, _ = image1.shape
-        for i in xrange(height):
-            for j in xrange(width):
-                if image_depth2[i, j] < image_depth1[i, j]:
-                    image_depth1[i, j] = image_depth2[i, j]
-                    image1[i, j] = image2[i, j]
+    def __overlay_images(self, image1, image_depth1, image2, image_depth2, closer):
+        """
+        Overlay image2 onto image1 in place wherever image2 is closer to the camera.
 
+        :param closer: boolean array of the images' size used as scratch space
+        """
+        np.less(image_depth2, image_depth1, out=closer)
+        np.copyto(image_depth1, image_depth2, where=closer)
+        np.copyto(image1, image2, where=closer[:, :, np.newaxis])
         return image1, image_depth1
 
 
@@ -259,16 +524,43 @@ class Quaternion(object):
             raise TypeError("Cannot multiply non-quaternion object.")
 
 
-def generate_video(width, height, frames, file_name, path='./app/static/video'):
+# Maximum number of rendered frames waiting to be encoded
+FRAME_QUEUE_SIZE = 16
+
+VIDEO_FPS = 15
+
+
+@timed('generate_video')
+def generate_video(width, height, frames, file_name, path='./app/static/video', queue_size=FRAME_QUEUE_SIZE):
+    """
+    Encode frames into an mp4 video.
+
+    :param frames: any iterable of frames, e.g. a generator rendering them lazily.
+    The frames are pulled on a background thread through a bounded queue, so
+    rendering overlaps with encoding and at most queue_size frames are held in
+    memory regardless of the video's length
+    :param queue_size: a queue size of 0 pulls the frames on the calling thread instead
+    :return: the url of the video
+    """
     print 'Generating video'
-    fps = 15
-    cap_size = (width, height)
-    fourcc = cv.CV_FOURCC('a', 'v', 'c', '1')  # Apple's version of the MPEG4 http://www.fourcc.org/codecs.php
-    file_path = '%s/%s.mp4' % (path, file_name)
-    writer = cv2.VideoWriter(file_path, fourcc, fps, cap_size, True)
-
-    for x in range(len(frames)):
-        writer.write(frames[x])
-    writer.release()
+    write_video(width, height, frames, '%s/%s.mp4' % (path, file_name), queue_size)
     print 'Video generation complete!'
     return '/static/video/%s.mp4' % (file_name)
+
+
+def write_video(width, height, frames, file_path, queue_size=FRAME_QUEUE_SIZE, fps=VIDEO_FPS, encoding=None):
+    """
+    Encode frames into an mp4 file, see generate_video
+
+    :param fps: frame rate of the video
+    :param encoding: the encoder and its settings, see open_encoder
+    """
+    encoder = open_encoder(file_path, width, height, fps, encoding)
+    try:
+        if queue_size > 0:
+            # Metrics recorded while rendering on the prefetching thread still count for the caller
+            frames = prefetch(collect_iteration(frames), queue_size)
+        for frame in frames:
+            encoder.write(frame)
+    finally:
+        encoder.close()
@@ -1,6 +1,8 @@
 
+import json
 from flask import render_template
 from app import app
+from metrics import metrics
 
 
 
@@ -8,3 +10,7 @@ from app import app
 def index():
     return render_template('index.html')
 
+
+@app.route('/metrics')
+def show_metrics():
+    return json.dumps(metrics.to_dict())
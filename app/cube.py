@@ -8,6 +8,8 @@ from datetime import datetime
 
 from camera import Camera, Quaternion, generate_video
 from surface import Surface, Polyhedron, Space
+from renderer import FrameRenderer
+from textures import load_texture
 
 # The world origin is chosen to be at the center of the cube.
 # Let the cube size be w. The bottom left corner of the
@@ -25,6 +27,7 @@ CUBE_SIZE = 100.0
 IMAGE_SIZE = 200
 CAMERA_DIST = 200
 CUBE_IMAGE_PATH = STATIC_PATH + '/cube'
+CUBE_TEXTURE_PATHS = [CUBE_IMAGE_PATH + '/%s.png' % face for face in ('front', 'left', 'right', 'top', 'bottom', 'back')]
 
 @app.route('/cube')
 def cube():
@@ -38,13 +41,9 @@ def cube():
     camera_path, camera_orientation = generate_path_and_orientation()
     # camera_path, camera_orientation = generate_path_and_orientation_from_higher_up()
 
-    frames = []
     start_time = datetime.now()
-    for camera_pos, camera_orientation in zip(camera_path, camera_orientation):
-        camera.position = camera_pos
-        camera.orientation = camera_orientation
-        frame = camera.project_space(space)
-        frames.append(frame)
+    renderer = FrameRenderer(camera, space, workers=RENDER_WORKERS)
+    frames = renderer.render(camera_path, camera_orientation)
 
     generate_video(camera.width, camera.height, frames, 'cube')
     print "time taken = ", datetime.now() - start_time
@@ -52,12 +51,8 @@ def cube():
 
 
 def build_cube(size, offset_x=0.0, offset_y=0.0, offset_z=0.0):
-    front_img = cv2.imread(CUBE_IMAGE_PATH + '/front.png', cv2.CV_LOAD_IMAGE_COLOR)
-    left_img = cv2.imread(CUBE_IMAGE_PATH + '/left.png', cv2.CV_LOAD_IMAGE_COLOR)
-    right_img = cv2.imread(CUBE_IMAGE_PATH + '/right.png', cv2.CV_LOAD_IMAGE_COLOR)
-    top_img = cv2.imread(CUBE_IMAGE_PATH + '/top.png', cv2.CV_LOAD_IMAGE_COLOR)
-    bottom_img = cv2.imread(CUBE_IMAGE_PATH + '/bottom.png', cv2.CV_LOAD_IMAGE_COLOR)
-    back_img = cv2.imread(CUBE_IMAGE_PATH + '/back.png', cv2.CV_LOAD_IMAGE_COLOR)
+    front_img, left_img, right_img, top_img, bottom_img, back_img = [load_texture(path)
+                                                                     for path in CUBE_TEXTURE_PATHS]
     p1 = [offset_x, offset_y, offset_z]
     p2 = [offset_x + size, offset_y, offset_z]
     p3 = [offset_x + size, offset_y, offset_z + size]
@@ -74,8 +69,9 @@ def build_cube(size, offset_x=0.0, offset_y=0.0, offset_z=0.0):
     bottom_surface = Surface(bottom_img, np.array([p1, p2, p6, p5]), img_2d_corners)
     back_surface = Surface(back_img, np.array([p7, p8, p5, p6]), img_2d_corners)
 
-    return Polyhedron([front_surface, left_surface, right_surface,
-                       top_surface, bottom_surface, back_surface])
+    surfaces = [front_surface, left_surface, right_surface, top_surface, bottom_surface, back_surface]
+    # Render workers map the textures rather than receive copies of them
+    return Polyhedron([surface.share_texture() for surface in surfaces])
 
 
 step = 5  # smaller is better
@@ -1,36 +1,56 @@
+import hashlib
+import os
 from app import *
 import cv2
 import numpy as np
+from cache import LRUCache
+from metrics import timed, increment
 from texture_extractor import TextureExtractor
 from surface import Surface, Line2D
+from textures import load_texture
 
 
 IMAGE_PATH = STATIC_PATH + '/img'
 SLICED_IMAGE_PATH = IMAGE_PATH + '/sliced'
+# The images offered by the Plan View
+ROOM_IMAGE_PATHS = [IMAGE_PATH + '/cmu.jpg', IMAGE_PATH + '/stanford.jpg']
 
+# Maximum number of bytes of sliced textures kept in memory
+SLICE_CACHE_SIZE = int(os.environ.get('SLICE_CACHE_SIZE', 256 * 1024 * 1024))
+# Optional directory in which sliced textures are also kept across restarts
+SLICE_CACHE_PATH = os.environ.get('SLICE_CACHE_PATH')
 
-def cut_image(image_name, space_dimension, inner_box, vanishing_point):
 
-    original_image = cv2.imread(IMAGE_PATH + '/' + image_name, cv2.CV_LOAD_IMAGE_COLOR)
+def surfaces_size(surfaces):
+    return sum(surface.image.nbytes for surface in surfaces)
 
-    extractor = TextureExtractor(original_image)
 
-    inner_top_left, inner_bottom_right = inner_box
-    image_height, image_width, _ = original_image.shape
-    space_width, space_height, space_depth = space_dimension
+sliced_surfaces_cache = LRUCache(SLICE_CACHE_SIZE, size_of=surfaces_size)
 
-    data = generate_corners_data(image_width, image_height, space_depth, inner_top_left, inner_bottom_right,
-                                 vanishing_point)
-    
-    all_surfaces_3d_corner = generate_corners_3dcoordinates(space_dimension)
 
-    surfaces = []
-    for texture_name, corners, depths in data:
+@timed('cut_image')
+def cut_image(image_name, space_dimension, inner_box, vanishing_point):
+    """
+    Slice an image into the 5 walls of a room. The surfaces are cached by the
+    image's content and the slicing parameters so that rendering another camera
+    path through the same scene skips decoding and warping the image.
+    """
+    key = slicing_key(image_name, space_dimension, inner_box, vanishing_point)
+    surfaces = sliced_surfaces_cache.get(key)
+    if surfaces is not None:
+        increment('cut_image.cache_hits')
+        return surfaces
+    increment('cut_image.cache_misses')
+
+    textures = load_cached_textures(key)
+    if textures is None:
+        textures = extract_textures(image_name, space_dimension, inner_box, vanishing_point)
+        save_cached_textures(key, textures)
 
-        # Extract textures to files
-        texture = extractor.extractTexture(corners)
-        cv2.imwrite(SLICED_IMAGE_PATH + '/' + image_name + '_' + texture_name + ".png", texture)
+    all_surfaces_3d_corner = generate_corners_3dcoordinates(space_dimension)
 
+    surfaces = []
+    for texture_name, texture in textures:
         # Retrieve 3D corners
         corners3d = all_surfaces_3d_corner[texture_name]
 
@@ -38,12 +58,89 @@ def cut_image(image_name, space_dimension, inner_box, vanishing_point):
         texture_height, texture_width, _ = texture.shape
         corners2d = np.float32([(0, 0), (texture_width, 0), (texture_width, texture_height), (0, texture_height)])
 
-        surface = Surface(texture, corners3d, corners2d)
+        # Render workers map the texture rather than receive a copy of it
+        surface = Surface(texture, corners3d, corners2d).share_texture()
         surfaces.append(surface)
 
+    sliced_surfaces_cache.put(key, surfaces)
     return surfaces
 
 
+def extract_textures(image_name, space_dimension, inner_box, vanishing_point):
+    """
+    :return: list of (texture_name, texture) for the 5 walls, in the order of generate_corners_data
+    """
+    original_image = load_texture(IMAGE_PATH + '/' + image_name)
+
+    extractor = TextureExtractor(original_image)
+
+    inner_top_left, inner_bottom_right = inner_box
+    image_height, image_width, _ = original_image.shape
+    space_width, space_height, space_depth = space_dimension
+
+    data = generate_corners_data(image_width, image_height, space_depth, inner_top_left, inner_bottom_right,
+                                 vanishing_point)
+
+    # All the walls are warped at once
+    textures = extractor.extractTextures([corners for _, corners, _ in data])
+
+    for (texture_name, _, _), texture in zip(data, textures):
+        # Extract textures to files
+        cv2.imwrite(SLICED_IMAGE_PATH + '/' + image_name + '_' + texture_name + ".png", texture)
+
+    return [(texture_name, texture) for (texture_name, _, _), texture in zip(data, textures)]
+
+
+_image_hashes = {}
+
+
+def image_content_hash(image_path):
+    """
+    SHA-1 of the image file, remembered for as long as the file's mtime and size don't change
+    """
+    stat = os.stat(image_path)
+    signature = (stat.st_mtime, stat.st_size)
+    if image_path not in _image_hashes or _image_hashes[image_path][0] != signature:
+        with open(image_path, 'rb') as image_file:
+            _image_hashes[image_path] = (signature, hashlib.sha1(image_file.read()).hexdigest())
+    return _image_hashes[image_path][1]
+
+
+def slicing_key(image_name, space_dimension, inner_box, vanishing_point):
+    (left, top), (right, bottom) = inner_box
+    parameters = (image_content_hash(IMAGE_PATH + '/' + image_name),
+                  tuple(float(x) for x in space_dimension),
+                  (float(left), float(top), float(right), float(bottom)),
+                  tuple(float(x) for x in vanishing_point))
+    return hashlib.sha1(repr(parameters)).hexdigest()
+
+
+def load_cached_textures(key):
+    if SLICE_CACHE_PATH is None:
+        return None
+    file_path = os.path.join(SLICE_CACHE_PATH, key + '.npz')
+    if not os.path.exists(file_path):
+        return None
+    archive = np.load(file_path)
+    names = archive['names']
+    return [(str(name), archive['texture%d' % i]) for i, name in enumerate(names)]
+
+
+def save_cached_textures(key, textures):
+    if SLICE_CACHE_PATH is None:
+        return
+    if not os.path.isdir(SLICE_CACHE_PATH):
+        os.makedirs(SLICE_CACHE_PATH)
+    arrays = dict(('texture%d' % i, texture) for i, (_, texture) in enumerate(textures))
+    arrays['names'] = np.array([name for name, _ in textures])
+    # Write to a temporary file first so that a concurrent reader never sees a partial archive
+    file_path = os.path.join(SLICE_CACHE_PATH, key + '.npz')
+    temp_path = '%s.%d.tmp' % (file_path, os.getpid())
+    with open(temp_path, 'wb') as archive:
+        np.savez(archive, **arrays)
+    os.rename(temp_path, file_path)
+
+
 def generate_corners_data(width, height, depth, inner_top_left, inner_bottom_right, vanishing_point):
     # This method assumes that when extrapolating the inner box, 
     # the line cuts the 2 side edges of the image not the top and the bottom boundaries.
@@ -0,0 +1,160 @@
+import os
+import re
+import subprocess
+import tempfile
+from distutils.spawn import find_executable
+
+import cv2.cv as cv
+import cv2 as cv2
+
+from metrics import increment
+
+
+# Encoder used when a video doesn't ask for one: 'ffmpeg', 'opencv', or 'auto'
+# for FFmpeg when it is installed and OpenCV otherwise
+VIDEO_ENCODER = os.environ.get('VIDEO_ENCODER', 'auto')
+
+# Settings of the FFmpeg encoder. A faster preset or a higher CRF encodes
+# faster into a larger, respectively lower quality, file. 0 threads lets
+# FFmpeg use all the cores
+VIDEO_CODEC = os.environ.get('VIDEO_CODEC', 'libx264')
+VIDEO_PRESET = os.environ.get('VIDEO_PRESET', 'veryfast')
+VIDEO_CRF = int(os.environ.get('VIDEO_CRF', 23))
+VIDEO_ENCODER_THREADS = int(os.environ.get('VIDEO_ENCODER_THREADS', 0))
+
+# Codec of the OpenCV encoder, Apple's version of the MPEG4 http://www.fourcc.org/codecs.php
+VIDEO_FOURCC = os.environ.get('VIDEO_FOURCC', 'avc1')
+
+# Codecs of FFmpeg which take a preset and a CRF, from 0 (lossless) to MAX_CRF
+PRESET_CODECS = ('libx264', 'libx265')
+MAX_CRF = 51
+
+OPTION_PATTERN = re.compile(r'^[\w-]+$')
+
+
+class FFmpegEncoder(object):
+    """
+    Streams raw BGR frames through a pipe to an ffmpeg process, which encodes
+    them on all the cores while the next frames are rendered.
+    """
+
+    def __init__(self, file_path, width, height, fps, codec=VIDEO_CODEC, preset=VIDEO_PRESET, crf=VIDEO_CRF,
+                 threads=VIDEO_ENCODER_THREADS, **options):
+        ffmpeg = find_executable('ffmpeg')
+        if ffmpeg is None:
+            raise IOError('Cannot encode a video into %s, ffmpeg is not installed' % file_path)
+
+        self.file_path = file_path
+        self.shape = (height, width, 3)
+        command = [ffmpeg, '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', '%dx%d' % (width, height), '-r', str(fps), '-i', '-',
+                   '-c:v', codec, '-threads', str(threads)]
+        if codec in PRESET_CODECS:
+            command += ['-preset', preset, '-crf', str(crf)]
+        # Browsers only play 4:2:0 videos, and only start before the end with the index up front
+        command += ['-pix_fmt', 'yuv420p', '-movflags', '+faststart', '-f', 'mp4', file_path]
+
+        # The errors go to a file rather than a pipe, which could fill up and block ffmpeg
+        self._errors = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self._errors)
+
+    def write(self, frame):
+        if frame.shape != self.shape:
+            raise ValueError('Frame of shape %s in a video of shape %s' % (frame.shape, self.shape))
+        try:
+            self._process.stdin.write(frame.astype('uint8', copy=False).tostring())
+        except IOError:
+            # ffmpeg exited, close reports why
+            self.close()
+            raise
+
+    def close(self):
+        if self._process.stdin.closed:
+            return
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            self._errors.seek(0)
+            message = self._errors.read().strip()
+            self._errors.close()
+            raise IOError('Cannot encode a video into %s: %s' % (self.file_path, message))
+        self._errors.close()
+
+
+class OpenCVEncoder(object):
+    """
+    Encodes frames with cv2.VideoWriter, on the calling thread. Which codecs are
+    available depends on how OpenCV was built.
+    """
+
+    def __init__(self, file_path, width, height, fps, fourcc=VIDEO_FOURCC, **options):
+        self._writer = cv2.VideoWriter(file_path, cv.CV_FOURCC(*fourcc), fps, (width, height), True)
+        if not self._writer.isOpened():
+            raise IOError('Cannot encode a video into %s' % file_path)
+
+    def write(self, frame):
+        self._writer.write(frame)
+
+    def close(self):
+        self._writer.release()
+
+
+# Encoders by name, each a class taking (file_path, width, height, fps, **options)
+# with write(frame) and close() methods
+ENCODERS = {
+    'ffmpeg': FFmpegEncoder,
+    'opencv': OpenCVEncoder,
+}
+
+
+def open_encoder(file_path, width, height, fps, encoding=None):
+    """
+    :param encoding: dict of the 'encoder' to use, see VIDEO_ENCODER, and its
+    options: 'codec', 'preset', 'crf' and 'threads' for FFmpeg, 'fourcc' for OpenCV.
+    When the encoder is 'auto' and FFmpeg fails to start, OpenCV is used instead
+    :return: an encoder writing into file_path
+    """
+    options = encoding_options(encoding)
+    name = requested = options.pop('encoder')
+    if name == 'auto':
+        name = 'ffmpeg' if find_executable('ffmpeg') is not None else 'opencv'
+    try:
+        encoder = ENCODERS[name](file_path, width, height, fps, **options)
+    except (IOError, OSError):
+        if requested != 'auto' or name == 'opencv':
+            raise
+        # ffmpeg could not be started after all
+        name = 'opencv'
+        encoder = OpenCVEncoder(file_path, width, height, fps, **options)
+    increment('encoder.%s' % name)
+    return encoder
+
+
+def encoding_options(encoding=None):
+    """
+    Check the encoding settings of a video, e.g. the ones of a request.
+
+    :return: the settings along with the 'encoder', which defaults to VIDEO_ENCODER
+    :raise ValueError: if a setting is unknown or invalid
+    """
+    options = dict(encoding or {})
+    unknown = set(options) - set(['encoder', 'codec', 'preset', 'crf', 'threads', 'fourcc'])
+    if unknown:
+        raise ValueError('Unknown encoding settings %s' % ', '.join(sorted(unknown)))
+
+    options.setdefault('encoder', VIDEO_ENCODER)
+    if options['encoder'] != 'auto' and options['encoder'] not in ENCODERS:
+        raise ValueError('Unknown encoder %s' % options['encoder'])
+    for name in ('codec', 'preset'):
+        if name in options and not OPTION_PATTERN.match(str(options[name])):
+            raise ValueError('Invalid %s %s' % (name, options[name]))
+    for name in ('crf', 'threads'):
+        if name in options:
+            options[name] = int(options[name])
+    if 'crf' in options and options.get('codec', VIDEO_CODEC) in PRESET_CODECS and \
+            not 0 <= options['crf'] <= MAX_CRF:
+        raise ValueError('crf must be between 0 and %d' % MAX_CRF)
+    if options.get('threads', 0) < 0:
+        raise ValueError('Invalid threads %s' % options['threads'])
+    if 'fourcc' in options and len(str(options['fourcc'])) != 4:
+        raise ValueError('Invalid fourcc %s' % options['fourcc'])
+    return options
@@ -1,23 +1,77 @@
 # Graham Scan - Tom Switzer <thomas.switzer@gmail.com>
+# Rewritten as Andrew's monotone chain over NumPy arrays
+
+import numpy as np
 
 TURN_LEFT, TURN_RIGHT, TURN_NONE = (1, -1, 0)
 
+# Relative margin within which a point counts as on an edge of the extreme
+# points' polygon rather than inside it, see _interiorPoints
+INTERIOR_TOLERANCE = 1e-9
+
 
 def isCW(p, q, r):
-    return cmp((q[0] - p[0]) * (r[1] - p[1]) - (r[0] - p[0]) * (q[1] - p[1]), 0)
+    turn = (q[0] - p[0]) * (r[1] - p[1]) - (r[0] - p[0]) * (q[1] - p[1])
+    return int(turn > 0) - int(turn < 0)
+
+
+def _interiorPoints(points):
+    """
+    Mask of the points strictly inside the polygon of the leftmost, lowest,
+    rightmost and highest points, computed for all the points at once. Those
+    points can't be on the hull, which usually leaves few points to scan.
+    Points within a small margin of an edge are not counted as inside, so that
+    rounding errors never drop a point of the hull.
+    """
+    xy = points[:, :2].astype(np.float64)
+    extremes = xy[[np.argmin(xy[:, 0]), np.argmin(xy[:, 1]), np.argmax(xy[:, 0]), np.argmax(xy[:, 1])]]
+    tolerance = INTERIOR_TOLERANCE * (np.abs(xy).max() + 1) ** 2
 
+    inside = np.ones(len(xy), bool)
+    for p, q in zip(extremes, np.roll(extremes, -1, axis=0)):
+        # The polygon is CCW, its inside is on the left of every edge. The turn of
+        # a repeated extreme point is 0, so nothing is inside a degenerate polygon
+        inside &= (q[0] - p[0]) * (xy[:, 1] - p[1]) - (xy[:, 0] - p[0]) * (q[1] - p[1]) > tolerance
+    return inside
 
-def _keepLeft(hull, r):
-    while len(hull) > 1 and isCW(hull[-2], hull[-1], r) != TURN_LEFT:
-            hull.pop()
-    if not len(hull) or hull[-1] != r:
-        hull.append(r)
-    return hull
+
+def _keepLeft(xs, ys):
+    """
+    Indices of the chain of points that only turns left, from the first to the last
+    point, by scanning the sorted points once with a stack. Each point is pushed and
+    popped at most once.
+    """
+    chain = []
+    for r in xrange(len(xs)):
+        while len(chain) > 1:
+            p, q = chain[-2], chain[-1]
+            if (xs[q] - xs[p]) * (ys[r] - ys[p]) - (xs[r] - xs[p]) * (ys[q] - ys[p]) > 0:
+                break
+            chain.pop()
+        chain.append(r)
+    return chain
 
 
 def calculateConvexHull(points):
-    """Returns points on convex hull of an array of points in CCW order."""
-    points = sorted(points)
-    l = reduce(_keepLeft, points, [])
-    u = reduce(_keepLeft, reversed(points), [])
-    return l.extend(u[i] for i in xrange(1, len(u) - 1)) or l
\ No newline at end of file
+    """
+    Returns points on convex hull of an array of points in CCW order, starting with
+    the lowest point of the smallest x. Collinear and repeated points are left out.
+    The points are (x, y) or (x, y, ...), the other coordinates are kept along.
+    Points at the same (x, y) count as one, the one that sorts first by its other
+    coordinates, e.g. the one with the smallest depth.
+    """
+    points = np.asarray(points)
+    if len(points) == 0:
+        return points
+
+    # Sort by x, then y, then the other coordinates, and drop the repeated positions
+    points = points[np.lexsort(points.T[::-1])]
+    repeated = np.all(points[1:, :2] == points[:-1, :2], axis=1)
+    points = points[np.concatenate([[True], ~repeated])]
+    points = points[~_interiorPoints(points)]
+
+    # Python numbers, so the turns are exact for integer coordinates
+    xs, ys = points[:, 0].tolist(), points[:, 1].tolist()
+    l = _keepLeft(xs, ys)
+    u = _keepLeft(xs[::-1], ys[::-1])
+    return np.concatenate([points[l], points[::-1][u[1:-1]]])
@@ -1,3 +1,9 @@
+import sys
+import threading
+from Queue import Queue, Full
+
+import cv2
+import numpy as np
 
 MAX_FLOAT32_COORD = 1e11
 
@@ -7,4 +13,91 @@ def box_coord(a):
         return MAX_FLOAT32_COORD
     elif a < -MAX_FLOAT32_COORD:
         return -MAX_FLOAT32_COORD
-    return a
\ No newline at end of file
+    return a
+
+
+_END_OF_ITERATION = object()
+
+
+def prefetch(iterable, size):
+    """
+    Iterate over an iterable on a background thread, keeping at most size
+    items buffered ahead of the consumer. This lets a slow producer (e.g. a
+    frame renderer) overlap with a slow consumer (e.g. a video encoder)
+    without ever holding more than size items in memory.
+
+    Exceptions raised by the producer are re-raised in the consumer.
+    """
+    buffer = Queue(size)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    break
+            else:
+                put((_END_OF_ITERATION, None))
+        except Exception:
+            put((_END_OF_ITERATION, sys.exc_info()))
+        finally:
+            if stopped.is_set() and hasattr(iterable, 'close'):
+                iterable.close()
+
+    producer = threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+
+    try:
+        while True:
+            item, error = buffer.get()
+            if error is not None:
+                raise error[0], error[1], error[2]
+            if item is _END_OF_ITERATION:
+                return
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
+
+
+def perspective_transforms(sources, destinations):
+    """
+    Vectorized cv2.getPerspectiveTransform.
+
+    :param sources: array of shape (N, 4, 2)
+    :param destinations: array of shape (N, 4, 2)
+    :return: array of shape (N, 3, 3) of the homographies mapping each source quad to its destination
+    """
+    num_of_quads = len(sources)
+    if num_of_quads == 0:
+        return np.zeros((0, 3, 3))
+
+    x, y = sources[:, :, 0], sources[:, :, 1]
+    u, v = destinations[:, :, 0], destinations[:, :, 1]
+    zeros, ones = np.zeros_like(x), np.ones_like(x)
+    # For each pair of corners (x, y) -> (u, v)
+    #   [x y 1 0 0 0 -x*u -y*u] . h = u
+    #   [0 0 0 x y 1 -x*v -y*v] . h = v
+    u_rows = np.dstack([x, y, ones, zeros, zeros, zeros, -x * u, -y * u])
+    v_rows = np.dstack([zeros, zeros, zeros, x, y, ones, -x * v, -y * v])
+    a = np.concatenate([u_rows, v_rows], axis=1)  # (N, 8, 8)
+    b = np.concatenate([u, v], axis=1)            # (N, 8)
+
+    try:
+        h = np.linalg.solve(a, b[:, :, np.newaxis])[:, :, 0]
+    except np.linalg.LinAlgError:
+        # Some quads are degenerate, let OpenCV deal with them one by one
+        return np.array([cv2.getPerspectiveTransform(np.float32(source), np.float32(destination))
+                         for source, destination in zip(sources, destinations)])
+
+    return np.concatenate([h, np.ones((num_of_quads, 1))], axis=1).reshape(num_of_quads, 3, 3)
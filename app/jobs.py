@@ -0,0 +1,156 @@
+import sys
+import threading
+import time
+import traceback
+import uuid
+from Queue import Queue
+
+from metrics import Metrics, collecting, increment
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class RenderJob(object):
+    def __init__(self, target, args):
+        """
+        :param target: function called as target(job, *args) to run the job.
+        Its return value becomes the job's result
+        """
+        self.id = uuid.uuid4().hex
+        self.target = target
+        self.args = args
+        self.status = QUEUED
+        self.frames_done = 0
+        self.num_of_frames = None
+        self.timings = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.metrics = Metrics()  # what the job's pipeline records while running
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+        if self.status == QUEUED:
+            self.status = CANCELLED
+            self.finished_at = time.time()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        """
+        Raise JobCancelled if the job has been cancelled. The job's target
+        should call it regularly, e.g. once per rendered frame.
+        """
+        if self.is_cancelled():
+            raise JobCancelled()
+
+    def report_progress(self, frames_done, num_of_frames):
+        self.frames_done = frames_done
+        self.num_of_frames = num_of_frames
+
+    def run(self):
+        if self.is_cancelled():
+            return
+        self.status = RUNNING
+        self.started_at = time.time()
+        try:
+            with collecting(self.metrics):
+                self.result = self.target(self, *self.args)
+            self.status = DONE
+        except JobCancelled:
+            self.status = CANCELLED
+        except Exception:
+            self.error = str(sys.exc_info()[1])
+            self.status = FAILED
+            traceback.print_exc()
+        finally:
+            self.finished_at = time.time()
+            increment('jobs.%s' % self.status)
+
+    def to_dict(self):
+        now = time.time()
+        counters, timers = self.metrics.snapshot()
+        return {
+            'id': self.id,
+            'status': self.status,
+            'progress': {'frames': self.frames_done, 'total': self.num_of_frames},
+            'timings': dict(self.timings,
+                            queued=(self.started_at or self.finished_at or now) - self.created_at,
+                            elapsed=(self.finished_at or now) - (self.started_at or now)),
+            'breakdown': dict((name, {'count': histogram.count, 'total': histogram.total})
+                              for name, histogram in timers.items()),
+            'counters': counters,
+            'result': self.result,
+            'error': self.error,
+        }
+
+
+class JobQueue(object):
+    """
+    Run jobs in the background on a fixed number of worker threads,
+    in submission order.
+    """
+
+    def __init__(self, concurrency=1, max_finished_jobs=100):
+        """
+        :param concurrency: number of jobs running at the same time
+        :param max_finished_jobs: number of finished jobs whose status is kept around
+        """
+        self.concurrency = concurrency
+        self.max_finished_jobs = max_finished_jobs
+        self._pending = Queue()
+        self._jobs = {}
+        self._finished_ids = []
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def submit(self, target, *args):
+        job = RenderJob(target, args)
+        increment('jobs.submitted')
+        with self._lock:
+            self._jobs[job.id] = job
+            self._start_workers()
+        self._pending.put(job)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def _start_workers(self):
+        # Workers are started lazily so that importing the app doesn't spawn threads
+        while len(self._workers) < self.concurrency:
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            job = self._pending.get()
+            job.run()
+            self._forget_old_jobs(job)
+
+    def _forget_old_jobs(self, finished_job):
+        with self._lock:
+            self._finished_ids.append(finished_job.id)
+            while len(self._finished_ids) > self.max_finished_jobs:
+                del self._jobs[self._finished_ids.pop(0)]
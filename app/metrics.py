@@ -0,0 +1,188 @@
+import copy
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+# Upper bounds of the duration histograms' buckets, in seconds
+TIMER_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, float('inf'))
+
+
+class Histogram(object):
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * len(TIMER_BUCKETS)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for i, bound in enumerate(TIMER_BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'buckets': dict(('%g' % bound, count) for bound, count in zip(TIMER_BUCKETS, self.buckets)),
+        }
+
+
+class Metrics(object):
+    """
+    A set of counters and duration histograms.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            if name not in self.timers:
+                self.timers[name] = Histogram()
+            self.timers[name].observe(seconds)
+
+    def snapshot(self):
+        """
+        :return: (counters, timers) copies that can be pickled, e.g. to send them across processes
+        """
+        with self._lock:
+            return dict(self.counters), copy.deepcopy(self.timers)
+
+    def merge(self, snapshot):
+        counters, timers = snapshot
+        with self._lock:
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, histogram in timers.items():
+                self.timers.setdefault(name, Histogram()).merge(histogram)
+
+    def to_dict(self):
+        counters, timers = self.snapshot()
+        return {
+            'counters': counters,
+            'timers': dict((name, histogram.to_dict()) for name, histogram in timers.items()),
+        }
+
+
+# Metrics of the whole process
+metrics = Metrics()
+
+# Additional Metrics the current thread records into, e.g. those of the job it runs
+_local = threading.local()
+
+
+def _active_collectors():
+    if not hasattr(_local, 'collectors'):
+        _local.collectors = []
+    return _local.collectors
+
+
+def increment(name, value=1):
+    metrics.increment(name, value)
+    for collector in _active_collectors():
+        collector.increment(name, value)
+
+
+def observe(name, seconds):
+    metrics.observe(name, seconds)
+    for collector in _active_collectors():
+        collector.observe(name, seconds)
+
+
+def merge(snapshot):
+    """
+    Record metrics collected elsewhere, e.g. in a worker process
+    """
+    metrics.merge(snapshot)
+    for collector in _active_collectors():
+        collector.merge(snapshot)
+
+
+@contextmanager
+def timer(name):
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        observe(name, time.time() - start_time)
+
+
+def timed(name):
+    """
+    Decorator recording the duration of every call of the function under the given name
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def collecting(collector=None):
+    """
+    Also record what the current thread records into collector while in the block.
+
+    :return: the collector, a new Metrics by default
+    """
+    collector = collector if collector is not None else Metrics()
+    collectors = _active_collectors()
+    collectors.append(collector)
+    try:
+        yield collector
+    finally:
+        collectors.remove(collector)
+
+
+def collect_iteration(iterable, collector=None):
+    """
+    Record what each step of iterable records into collector, whichever thread
+    iterates over it. Useful for generators consumed on a background thread.
+
+    :param collector: a Metrics, or None for the collectors active on the calling thread
+    """
+    collectors = [collector] if collector is not None else list(_active_collectors())
+    return _collect_iteration(iter(iterable), collectors)
+
+
+def _collect_iteration(iterator, collectors):
+    while True:
+        # Collectors already active on the iterating thread must not record twice
+        added = [collector for collector in collectors if collector not in _active_collectors()]
+        _active_collectors().extend(added)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            for collector in added:
+                _active_collectors().remove(collector)
+        yield item
@@ -0,0 +1,138 @@
+import numpy as np
+
+from camera import RenderTarget
+from helper import perspective_transforms
+from metrics import timed
+
+
+# Largest difference in camera position and orientation matrix entries for
+# 2 poses to be considered the same, and their frame rendered once
+POSE_TOLERANCE = 1e-6
+
+
+class RenderPlan(object):
+    """
+    Everything needed to render the frames of a camera path except the warps
+    themselves: for every frame and every surface of a space, whether the
+    surface is visible and the homography from its texture to the frame.
+    Surfaces are indexed in the order of Space.surfaces().
+    """
+
+    def __init__(self, positions, orientations, visible, homographies, distances, repeats=None):
+        """
+        :param positions: array of shape (F, 3) of the camera positions
+        :param orientations: array of shape (F, 3, 3) of the camera orientations
+        :param visible: boolean array of shape (F, S)
+        :param homographies: array of shape (F, S, 3, 3). Only meaningful where visible
+        :param distances: array of shape (F, S, 4) of the distances from the surfaces'
+        corners to the image plane, used for clipping
+        :param repeats: boolean array of shape (F,), whether a frame's pose is the
+        same as the previous frame's, which can then be reused. None if no pose repeats
+        """
+        self.positions = positions
+        self.orientations = orientations
+        self.visible = visible
+        self.homographies = homographies
+        self.distances = distances
+        self.repeats = repeats if repeats is not None else np.zeros(len(positions), bool)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, frames):
+        """
+        :param frames: a slice or an array of frame indices
+        :return: the plan of the selected frames
+        """
+        return RenderPlan(self.positions[frames], self.orientations[frames], self.visible[frames],
+                          self.homographies[frames], self.distances[frames], self.repeats[frames])
+
+
+@timed('plan_path')
+def plan_path(camera, surfaces, positions, orientations, pose_tolerance=POSE_TOLERANCE):
+    """
+    Work out the visibility of every surface and all the homographies for a
+    whole camera path at once.
+
+    :param camera: the camera whose intrinsics are used
+    :param surfaces: list of S surfaces, e.g. space.surfaces()
+    :param positions: array of shape (F, 3) of the camera positions
+    :param orientations: array of shape (F, 3, 3) of the camera orientations
+    :param pose_tolerance: see repeated_poses. None never reuses frames
+    :return: a RenderPlan
+    """
+    positions = np.asarray(positions, np.float64).reshape(-1, 3)
+    orientations = np.asarray(orientations, np.float64).reshape(-1, 3, 3)
+    num_of_frames, num_of_surfaces = len(positions), len(surfaces)
+    repeats = repeated_poses(positions, orientations, pose_tolerance) if pose_tolerance is not None else None
+    if num_of_surfaces == 0:
+        return RenderPlan(positions, orientations, np.zeros((num_of_frames, 0), bool),
+                          np.zeros((num_of_frames, 0, 3, 3)), np.zeros((num_of_frames, 0, 4)), repeats)
+
+    corners3d = np.array([surface.edge_points3d for surface in surfaces], np.float64)  # (S, 4, 3)
+    corners2d = np.array([surface.edge_points2d for surface in surfaces], np.float64)  # (S, 4, 2)
+    normals = np.array([surface.normal for surface in surfaces], np.float64)           # (S, 3)
+
+    # Backface culling: the camera must be in front of the surface
+    camera_wrt_surfaces = positions[:, np.newaxis, :] - corners3d[np.newaxis, :, 0, :]
+    facing = np.einsum('fsk,sk->fs', camera_wrt_surfaces, normals) > 0
+
+    # Distances from the corners to the image plane, along the optical axis
+    corners_wrt_camera = corners3d[np.newaxis, :, :, :] - positions[:, np.newaxis, np.newaxis, :]
+    distances = np.einsum('fsck,fk->fsc', corners_wrt_camera, orientations[:, 2, :])
+    visible = facing & (distances > 0).any(axis=2)
+
+    projected = camera.project_points(corners3d.reshape(-1, 3), positions, orientations)
+    projected = projected.reshape(num_of_frames, num_of_surfaces, 4, 2) + (camera.half_width, camera.half_height)
+
+    homographies = np.zeros((num_of_frames, num_of_surfaces, 3, 3))
+    frame_indices, surface_indices = np.nonzero(visible)
+    homographies[frame_indices, surface_indices] = perspective_transforms(
+        corners2d[surface_indices], projected[frame_indices, surface_indices])
+
+    return RenderPlan(positions, orientations, visible, homographies, distances, repeats)
+
+
+def repeated_poses(positions, orientations, tolerance=POSE_TOLERANCE):
+    """
+    Find the frames whose pose is within tolerance of the last frame that is not
+    itself a repeat. Comparing against that frame rather than the previous one keeps
+    a slow drift of the camera from being skipped altogether.
+
+    :param positions: array of shape (F, 3) of the camera positions
+    :param orientations: array of shape (F, 3, 3) of the camera orientations
+    :return: boolean array of shape (F,)
+    """
+    repeats = np.zeros(len(positions), bool)
+    # Only frames close to their predecessor can be close to the reference frame
+    candidates = np.zeros(len(positions), bool)
+    candidates[1:] = ((np.abs(np.diff(positions, axis=0)).max(axis=1) <= tolerance) &
+                      (np.abs(np.diff(orientations, axis=0)).max(axis=(1, 2)) <= tolerance))
+    reference = 0
+    for index in np.nonzero(candidates)[0]:
+        if not repeats[index - 1]:
+            reference = index - 1
+        repeats[index] = (np.abs(positions[index] - positions[reference]).max() <= tolerance and
+                          np.abs(orientations[index] - orientations[reference]).max() <= tolerance)
+    return repeats
+
+
+@timed('render_frame')
+def render_planned_frame(camera, surfaces, plan, index, target=None):
+    """
+    Render a frame of a plan, which only warps and composites the visible surfaces.
+
+    :param surfaces: the surfaces the plan was made for
+    :param index: index of the frame in the plan
+    :param target: (optional) the RenderTarget to render into, see Camera.project_surfaces
+    """
+    if target is None:
+        target = RenderTarget(camera.width, camera.height)
+    camera.position = plan.positions[index]
+    camera.orientation = plan.orientations[index]
+    visible_surfaces = np.nonzero(plan.visible[index])[0]
+    return camera.composite_surfaces(
+        ((surfaces[i],) + camera.warp_surface(surfaces[i], plan.homographies[index, i], plan.distances[index, i],
+                                              target)
+         for i in visible_surfaces),
+        target)
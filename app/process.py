@@ -1,19 +1,288 @@
 from flask import request
+import cProfile
+import hashlib
 import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 from app import *
 import cv2
 import numpy as np
 from math import *
 
-from camera import Camera, generate_video
+from camera import Camera, write_video, COMPOSITE_OR, COMPOSITE_DEPTH, FRAME_QUEUE_SIZE, VIDEO_FPS
 from surface import Surface, Polyhedron, Space
+from renderer import FrameRenderer
+from jobs import JobQueue, QUEUED, RUNNING
+from scenes import save_scene, load_scene, scene_exists
+from segments import SegmentManifest, SEGMENTS_PATH, concatenate_videos
+from video_cache import VideoCache
+from encoders import encoding_options
+from metrics import timed, increment
 from cut_image import *
 
 SLICED_IMAGE_PATH = STATIC_PATH + '/img/sliced'
+VIDEO_PATH = STATIC_PATH + '/video'
+
+CAMERA_WIDTH = 970
+CAMERA_HEIGHT = 400
+
+# Where the cProfile dumps of renders requested with 'profile' are written
+PROFILE_PATH = os.environ.get('PROFILE_PATH', tempfile.gettempdir())
+
+# Previews are rendered this many times smaller, keeping one frame out of PREVIEW_FRAME_STEP
+PREVIEW_SCALE = float(os.environ.get('PREVIEW_SCALE', 0.25))
+PREVIEW_FRAME_STEP = int(os.environ.get('PREVIEW_FRAME_STEP', 3))
+
+render_jobs = JobQueue(RENDER_JOB_CONCURRENCY)
+rendered_videos = VideoCache(VIDEO_PATH, '/static/video')
+# Key of each video being rendered -> the job rendering it, see submit_render
+rendering_jobs = {}
+rendering_jobs_lock = threading.Lock()
+
+# The parts of a /generate_video request that make up the video
+VIDEO_PARAMETERS = ('image', 'world', 'planeRect', 'vanishingPoint', 'scene', 'camera_path', 'compositing',
+                    'samples_per_segment', 'duration', 'camera_speed', 'encoding')
+
 
 @app.route('/generate_video', methods=['POST'])
 def process():
     data = json.loads(request.data)
+    if 'scene' in data and not scene_exists(data['scene']):
+        return json.dumps({'status': 'error', 'message': 'Unknown scene'}), 404
+    try:
+        encoding_options(data.get('encoding'))
+        samples_per_segment(data)
+        compositing_mode(data)
+        path_timing(data)
+    except (TypeError, ValueError) as error:
+        return json.dumps({'status': 'error', 'message': str(error)}), 400
+
+    # The same request was rendered before, answer with its video. Profiling
+    # is about rendering, which this would skip
+    src = rendered_videos.get(render_key(dict(data, preview=False))) if not data.get('profile') else None
+    if src is not None:
+        return json.dumps({'status': 'done', 'video': video_result(data['file_name'], src, preview=False)})
+
+    if data.get('preview'):
+        # The preview is queued first, and the full render right after it
+        preview_job = submit_render(dict(data, file_name='%s_preview' % data['file_name']))
+        job = submit_render(dict(data, preview=False))
+        return json.dumps({'status': 'queued', 'job': preview_job.to_dict(), 'upgrade': job.to_dict()})
+
+    job = submit_render(data)
+    return json.dumps({'status': 'queued', 'job': job.to_dict()})
+
+
+def submit_render(data):
+    """
+    Queue the render of a /generate_video request, unless the same video is
+    already being rendered, e.g. when the page is reloaded. Profiled renders
+    are always queued, each has its own profile.
+
+    :return: the job rendering the video
+    """
+    if data.get('profile'):
+        return render_jobs.submit(render_video, data)
+
+    key = render_key(data)
+    with rendering_jobs_lock:
+        for other_key, other_job in rendering_jobs.items():
+            if other_job.status not in (QUEUED, RUNNING):
+                del rendering_jobs[other_key]
+
+        job = rendering_jobs.get(key)
+        if job is None or job.is_cancelled():
+            job = render_jobs.submit(render_video, data)
+            rendering_jobs[key] = job
+        return job
+
+
+@app.route('/scenes', methods=['POST'])
+def register_scene():
+    """
+    Slice the image into a scene once, so that /generate_video can then render
+    camera paths through it given only the scene's id.
+    """
+    data = json.loads(request.data)
+    scene_id = save_scene(build_space(data), data['world'])
+    return json.dumps({'status': 'ok', 'scene': scene_id})
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = render_jobs.get(job_id)
+    if job is None:
+        return json.dumps({'status': 'error', 'message': 'Unknown job'}), 404
+    return json.dumps(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    """
+    Submit a job's request again. The segments of the video that were already
+    encoded are not rendered again.
+    """
+    job = render_jobs.get(job_id)
+    if job is None:
+        return json.dumps({'status': 'error', 'message': 'Unknown job'}), 404
+    retried_job = submit_render(*job.args)
+    return json.dumps({'status': 'queued', 'job': retried_job.to_dict()})
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = render_jobs.cancel(job_id)
+    if job is None:
+        return json.dumps({'status': 'error', 'message': 'Unknown job'}), 404
+    return json.dumps(job.to_dict())
+
+
+def render_video(job, data):
+    if not data.get('profile'):
+        return render_video_pipeline(job, data)
+
+    # Render everything on the job's thread so that a single profiler sees all of it
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        video = render_video_pipeline(job, data, workers=1, queue_size=0)
+    finally:
+        profiler.disable()
+    video['profile'] = os.path.join(PROFILE_PATH, '%s.prof' % job.id)
+    profiler.dump_stats(video['profile'])
+    return video
+
+
+def render_video_pipeline(job, data, workers=RENDER_WORKERS, queue_size=FRAME_QUEUE_SIZE):
+    start_time = time.time()
+    if 'scene' in data:
+        space, world_dimension_data = load_scene(data['scene'])
+        if space is None:
+            raise ValueError('Unknown scene %s' % data['scene'])
+    else:
+        space, world_dimension_data = build_space(data), data['world']
+    job.timings['slicing'] = time.time() - start_time
+    job.check_cancelled()
+
+    start_time = time.time()
+    # Checked before rendering anything, the settings may come straight from the request
+    encoding = encoding_options(data.get('encoding'))
+    key = render_key(data)
+    if key in rendered_videos and not data.get('profile'):
+        # An identical job queued earlier rendered the video in the meantime
+        return video_result(data['file_name'], rendered_videos.url(key), data.get('preview'))
+
+    camera_width = CAMERA_WIDTH
+    camera_height = CAMERA_HEIGHT
+    camera_depth = world_dimension_data['depth']
+    BEZIER_PATH_ORDER = 3
+    compositing = compositing_mode(data)
+    # Previews scale the whole image plane down, focal length included, so they show the same view
+    scale = PREVIEW_SCALE if data.get('preview') else 1.0
+    # Video encoders want even sizes
+    camera = Camera(camera_depth/2 * scale, width=int(camera_width * scale) / 2 * 2,
+                    height=int(camera_height * scale) / 2 * 2, compositing=compositing)
+    camera_path, camera_angles = generate_bezier_path_and_orientations(data['camera_path'], BEZIER_PATH_ORDER,
+                                                                       samples_per_segment(data))
+    heading = camera_angles.astype(int) != 0
+    if 'duration' in data or 'camera_speed' in data:
+        # Spend a fixed number of frames on the path, whatever its control points' spacing
+        num_of_frames, camera_speed = path_timing(data)
+        smooth_camera_path, smooth_camera_angles = resample_camera_path(
+            camera_path[heading], camera_angles[heading], num_of_frames, camera_speed=camera_speed)
+    else:
+        smooth_camera_path, smooth_camera_angles = smoothen_camera(camera_path[heading], camera_angles[heading])
+    fps = VIDEO_FPS
+    if data.get('preview'):
+        # Fewer frames, shown for longer, so that the preview lasts as long as the video
+        smooth_camera_path = smooth_camera_path[::PREVIEW_FRAME_STEP]
+        smooth_camera_angles = smooth_camera_angles[::PREVIEW_FRAME_STEP]
+        fps = VIDEO_FPS / float(PREVIEW_FRAME_STEP)
+    job.timings['path'] = time.time() - start_time
+
+    start_time = time.time()
+    renderer = FrameRenderer(camera, space, workers=workers)
+    plan = renderer.plan(smooth_camera_path, smooth_camera_angles)
+
+    # The segments of a failed job are kept, so the same request renders only the missing ones.
+    # A profiled render starts from scratch in segments of its own
+    segments_key = '%s.%s' % (key, job.id) if data.get('profile') else key
+    manifest = SegmentManifest(os.path.join(SEGMENTS_PATH, segments_key), len(plan))
+    frames_done = manifest.completed_frames()
+    job.report_progress(frames_done, len(plan))
+
+    def report_progress(frames_rendered):
+        # Called for every frame, or regularly while workers render
+        job.report_progress(frames_done + frames_rendered, len(plan))
+        job.check_cancelled()
+
+    segments = renderer.render_segments(plan, manifest.pending(), queue_size, fps, encoding, report_progress)
+    for index, start, end, _ in segments:
+        manifest.complete(index)
+        increment('frames_rendered', end - start)
+        job.check_cancelled()
+
+    # Only move the video into the cache once complete, readers never see a partial video
+    temp_path = os.path.join(VIDEO_PATH, '%s.%s.part.mp4' % (key, job.id))
+    segment_paths = [file_path for _, _, _, file_path in manifest.segments()]
+    try:
+        if segment_paths:
+            concatenate_videos(camera.width, camera.height, segment_paths, temp_path, fps, encoding)
+        else:
+            write_video(camera.width, camera.height, [], temp_path, fps=fps, encoding=encoding)
+    except:
+        # The video cache never sees the partial file, so it would never be evicted
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.rename(temp_path, rendered_videos.file_path(key))
+    src = rendered_videos.put(key)
+    shutil.rmtree(manifest.directory, ignore_errors=True)
+    job.timings['rendering'] = time.time() - start_time
+
+    return video_result(data['file_name'], src, data.get('preview'))
+
+
+def video_result(file_name, src, preview):
+    # Previews are meant to be shown at the size of the full video
+    return {'name': file_name, 'width': CAMERA_WIDTH, 'height': CAMERA_HEIGHT, 'src': src, 'preview': bool(preview)}
+
+
+def render_key(data):
+    """
+    :return: a key identifying the video a /generate_video request renders,
+    whatever its file name. It changes along with the content of the image
+    """
+    parameters = dict((name, data[name]) for name in VIDEO_PARAMETERS if data.get(name) is not None)
+    parameters['camera'] = (CAMERA_WIDTH, CAMERA_HEIGHT)
+    if data.get('preview'):
+        parameters['preview'] = (PREVIEW_SCALE, PREVIEW_FRAME_STEP)
+    image_path = IMAGE_PATH + '/' + data.get('image', '')
+    if 'image' in data and os.path.isfile(image_path):
+        parameters['image_hash'] = image_content_hash(image_path)
+    return hashlib.sha1(json.dumps(parameters, sort_keys=True)).hexdigest()
+
+
+def compositing_mode(data):
+    """
+    :return: the compositing mode asked by a /generate_video request, COMPOSITE_OR by default
+    :raise ValueError: if it is neither COMPOSITE_OR nor COMPOSITE_DEPTH
+    """
+    compositing = data.get('compositing') or COMPOSITE_OR
+    if compositing not in (COMPOSITE_OR, COMPOSITE_DEPTH):
+        raise ValueError('Unknown compositing %s' % compositing)
+    return compositing
+
+
+def build_space(data):
+    """
+    :param data: the room to slice out of the image, with the 'image', its
+    'planeRect' and 'vanishingPoint', and the dimensions of the 'world'
+    :return: the Space of the room
+    """
     space = Space()
     world_dimension_data = data['world']
     space_dimension = (world_dimension_data['width'], world_dimension_data['height'], world_dimension_data['depth'])
@@ -26,111 +295,214 @@ def process():
 
     surfaces = cut_image(image_name, space_dimension, inner_box, vanishing_point)
     space.add_model(Polyhedron(surfaces))
+    return space
+
 
-    camera_width = 970
-    camera_height = 400
-    camera_depth = world_dimension_data['depth']
-    BEZIER_PATH_ORDER = 3
-    camera = Camera(camera_depth/2, width=camera_width, height=camera_height)
-    camera_path, camera_angles = generate_bezier_path_and_orientations(data['camera_path'], BEZIER_PATH_ORDER)
-    filtered_camera_path, filtered_camera_angles = [], []
-    for i in range(len(camera_path)):
-        if int(camera_angles[i]) != 0:
-            filtered_camera_path.append(camera_path[i])
-            filtered_camera_angles.append(camera_angles[i])
-    
-    smooth_camera_path, smooth_camera_angles = smoothen_camera(filtered_camera_path, filtered_camera_angles)
-    
-    frames = []
-    num_of_frames = len(smooth_camera_path)
-    for index, (position, orientation) in enumerate(zip(smooth_camera_path, smooth_camera_angles)):
-        print 'Generating frame:', index + 1, '/', num_of_frames
-        camera.position = position
-        camera.orientation = orientation
-        frame = camera.project_space(space)
-        frames.append(frame)
-
-    file_name = data['file_name']
-    file_path = generate_video(camera.width, camera.height, frames, file_name)
-
-    return json.dumps({ 'status': 'success', 
-                        'video': {'name': file_name, 'width': camera_width, 'height': camera_height, 'src': file_path}
-                    })
 
 NUM_LINE_SEGMENTS = 256
 
-def generate_bezier_path_and_orientations(points_list, order):
+# Bounds of the number of path points sampled per Bezier curve. The height
+# takes a third of the samples between each pair of control points, so it
+# needs at least 3 of them, and the samples of all the curves are held at once
+MIN_LINE_SEGMENTS = 3
+MAX_LINE_SEGMENTS = int(os.environ.get('MAX_LINE_SEGMENTS', 4096))
+
+
+def samples_per_segment(data):
+    """
+    :return: the number of path points sampled per Bezier curve asked by a /generate_video request
+    :raise ValueError: if it is out of [MIN_LINE_SEGMENTS, MAX_LINE_SEGMENTS]
+    """
+    num_samples = int(data.get('samples_per_segment', NUM_LINE_SEGMENTS))
+    if not MIN_LINE_SEGMENTS <= num_samples <= MAX_LINE_SEGMENTS:
+        raise ValueError('samples_per_segment must be between %d and %d' % (MIN_LINE_SEGMENTS, MAX_LINE_SEGMENTS))
+    return num_samples
+
+
+# Most frames of a video, 10 minutes by default
+MAX_FRAMES = int(os.environ.get('MAX_FRAMES', 10 * 60 * VIDEO_FPS))
+
+
+def path_timing(data):
+    """
+    :return: (num_frames, camera_speed) asked by a /generate_video request through its
+    'duration' in seconds and 'camera_speed', see resample_camera_path. num_frames is
+    None without a duration
+    :raise ValueError: if either is not a positive number or the video would take more than MAX_FRAMES
+    """
+    num_frames = None
+    if 'duration' in data:
+        duration = float(data['duration'])
+        if not 0 < duration * VIDEO_FPS <= MAX_FRAMES:
+            raise ValueError('duration must be positive and at most %d seconds' % (MAX_FRAMES / VIDEO_FPS))
+        num_frames = max(int(duration * VIDEO_FPS), 1)
+    camera_speed = float(data.get('camera_speed', CAMERA_SPEED))
+    if not 0 < camera_speed < float('inf'):
+        raise ValueError('camera_speed must be a positive number')
+    return num_frames, camera_speed
+
+
+@timed('bezier_path')
+def generate_bezier_path_and_orientations(points_list, order, num_samples=NUM_LINE_SEGMENTS):
+    """
+    Sample a path of cubic Bezier curves through the control points, all segments at once.
+
+    :param points_list: list of control points, each a dict with keys 'x', 'y' and 'z'
+    :param order: order of the Bezier curves. Only 3 is supported
+    :param num_samples: number of path points sampled per Bezier curve, within
+    [MIN_LINE_SEGMENTS, MAX_LINE_SEGMENTS]
+    :return: (path_points, path_angles) where path_points is an array of shape (N, 3)
+    and path_angles an array of shape (N,) of the headings in whole degrees in [0, 360)
+    """
+    if not MIN_LINE_SEGMENTS <= num_samples <= MAX_LINE_SEGMENTS:
+        raise ValueError('Cannot sample %s points per Bezier curve' % num_samples)
+
     # Camera's horizontal axis is world's x-axis
     # Camera's vertical axis is the opposite of the world's z-axis
     # Camera's optical axis is the world's y-axis
     # forward: [[1, 0, 0], [0, 0, -1], [0, 1, 0]]
     num_bezier_sets = (len(points_list) - 1) / order
-    prev_p2 = {}
-    path_points = []
-    path_angles = []
-    for i in range(num_bezier_sets):
-        p0 = points_list[i * order]
-        if i != 0:
-            # Modify the second point to make it C1 continuous
-            diff_x = p0['x'] - prev_p2['x']
-            diff_y = p0['y'] - prev_p2['y']
-            p1 = {}
-            p1['x'] = p0['x'] + diff_x
-            p1['y'] = p0['y'] + diff_y
-            p1['z'] = points_list[i * order + 1]['z']
-        else:
-            p1 = points_list[i * order + 1]
-        p2 = points_list[i * order + 2]
-        p3 = points_list[i * order + 3]
-        segment_chunk_length = NUM_LINE_SEGMENTS / 3
-        for j in range(NUM_LINE_SEGMENTS):
-            # Generate path points between control points
-            t = float(j) / NUM_LINE_SEGMENTS
-            x = ((1-t)**3)*p0['x'] + 3*((1-t)**2)*t*p1['x'] + 3*(1-t)*(t**2)*p2['x'] + (t**3)*p3['x']
-            y = ((1-t)**3)*p0['y'] + 3*((1-t)**2)*t*p1['y'] + 3*(1-t)*(t**2)*p2['y'] + (t**3)*p3['y']
-            if 0 <= j < segment_chunk_length:
-                z = (p1['z']-p0['z']) * (float(j%segment_chunk_length)/segment_chunk_length) + p0['z']
-            elif segment_chunk_length <= j < 2*segment_chunk_length:
-                z = (p2['z']-p1['z']) * (float(j%segment_chunk_length)/segment_chunk_length) + p1['z']
-            elif 2*segment_chunk_length <= j:
-                z = (p3['z']-p2['z']) * (float(j%segment_chunk_length)/segment_chunk_length) + p2['z']
-            path_points.append((x, y, z))
-
-        for j in range(NUM_LINE_SEGMENTS):
-            # Calculate the orientation for each path point
-            t = float(j) / NUM_LINE_SEGMENTS
-            dQtx = 3*((1-t)**2)*(p1['x']-p0['x']) + 6*(1-t)*t*(p2['x']-p1['x']) + 3*(t**2)*(p3['x']-p2['x'])
-            dQty = 3*((1-t)**2)*(p1['y']-p0['y']) + 6*(1-t)*t*(p2['y']-p1['y']) + 3*(t**2)*(p3['y']-p2['y'])
-            angle_rad = atan2(dQty, dQtx)
-            angle_deg = ceil(angle_rad/pi * 180)
-            angle_deg = (angle_deg + 360) % 360
-            path_angles.append(angle_deg)
-        prev_p2 = p2
-    return path_points, path_angles
+    if num_bezier_sets < 1:
+        return np.zeros((0, 3)), np.zeros(0)
+
+    points = np.array([(p['x'], p['y'], p['z']) for p in points_list[:num_bezier_sets * order + 1]], np.float64)
+    p0 = points[0:-1:order]
+    p1 = points[1::order].copy()
+    p2 = points[2::order]
+    p3 = points[3::order]
+    # Modify the second point to make it C1 continuous
+    p1[1:, :2] = 2 * p0[1:, :2] - p2[:-1, :2]
+
+    # Every array below is of shape (num_bezier_sets, num_samples, ...)
+    p0, p1, p2, p3 = [p[:, np.newaxis, :] for p in (p0, p1, p2, p3)]
+    j = np.arange(num_samples)
+    t = (j.astype(np.float64) / num_samples)[np.newaxis, :, np.newaxis]
 
+    # Generate path points between control points
+    xy = ((1-t)**3)*p0[..., :2] + 3*((1-t)**2)*t*p1[..., :2] + 3*(1-t)*(t**2)*p2[..., :2] + (t**3)*p3[..., :2]
+
+    # The height is interpolated linearly between consecutive control points,
+    # each taking a third of the samples
+    segment_chunk_length = num_samples / 3
+    chunk = np.minimum(j / segment_chunk_length, 2)
+    fraction = (j % segment_chunk_length).astype(np.float64) / segment_chunk_length
+    z_controls = np.concatenate([p0[..., 2], p1[..., 2], p2[..., 2], p3[..., 2]], axis=1)
+    z_start = z_controls[:, chunk]
+    z = (z_controls[:, chunk + 1] - z_start) * fraction + z_start
+
+    # Calculate the orientation for each path point
+    dQt = 3*((1-t)**2)*(p1[..., :2]-p0[..., :2]) + 6*(1-t)*t*(p2[..., :2]-p1[..., :2]) + \
+        3*(t**2)*(p3[..., :2]-p2[..., :2])
+    angle_rad = np.arctan2(dQt[..., 1], dQt[..., 0])
+    angle_deg = np.ceil(angle_rad/pi * 180)
+    angle_deg = (angle_deg + 360) % 360
+
+    path_points = np.dstack([xy, z]).reshape(-1, 3)
+    return path_points, angle_deg.ravel()
+
+
+@timed('smoothen_camera')
 def smoothen_camera(camera_path, camera_angles):
-    # The change in camera orientation between two immediate path points can be large
-    # if the turning angle is big. Hence we interpolate the orientations between
-    # two immediate path points to make the change in oriengation gradual
-    final_path_points, final_camera_angles = [], []
-    vertical_vector = np.array([0, 0, -1])
-    for i in range(1, len(camera_angles)):
-        step = 1 if camera_angles[i] > camera_angles[i-1] else -1
-        start_range = int(camera_angles[i-1])
-        end_range = (int(camera_angles[i]) + 1) if (int(camera_angles[i-1]) - int(camera_angles[i]) == 0) else int(camera_angles[i])
-        if abs(camera_angles[i] - camera_angles[i-1]) > 180:
-            if camera_angles[i] > camera_angles[i-1]:
-                start_range += 360
-                end_range = int(camera_angles[i])
-                step = -1
-            else:
-                start_range = int(camera_angles[i]) + 360
-                end_range = int(camera_angles[i-1])
-                step = 1
-        for angle_deg in range(start_range, end_range, step):
-            # Interpolate between two orientations to make the camera turning smooth
-            optical_vector = np.array([cos(float(angle_deg)/180 * pi), sin(float(angle_deg)/180 * pi), 0])
-            horizontal_vector = np.cross(vertical_vector, optical_vector)
-            final_camera_angles.append(np.array([horizontal_vector, vertical_vector, optical_vector]))
-            final_path_points.append(camera_path[i])
-    return final_path_points, final_camera_angles
+    """
+    The change in camera orientation between two immediate path points can be large
+    if the turning angle is big. Hence we interpolate the orientations between
+    two immediate path points to make the change in orientation gradual, one
+    frame per degree.
+
+    :param camera_path: array of shape (N, 3) of the path points
+    :param camera_angles: array of shape (N,) of the headings in degrees
+    :return: (positions, orientations) as arrays of shape (M, 3) and (M, 3, 3)
+    """
+    camera_path = np.asarray(camera_path, np.float64).reshape(-1, 3)
+    angles = np.asarray(camera_angles, np.float64)
+    previous, current = angles[:-1], angles[1:]
+    previous_deg, current_deg = previous.astype(int), current.astype(int)
+
+    step = np.where(current > previous, 1, -1)
+    start_range = previous_deg.copy()
+    end_range = np.where(previous_deg == current_deg, current_deg + 1, current_deg)
+    # Turning more than half a circle: turn the other way around instead
+    wrap_up = (np.abs(current - previous) > 180) & (current > previous)
+    wrap_down = (np.abs(current - previous) > 180) & (current <= previous)
+    start_range[wrap_up] += 360
+    end_range[wrap_up] = current_deg[wrap_up]
+    step[wrap_up] = -1
+    start_range[wrap_down] = current_deg[wrap_down] + 360
+    end_range[wrap_down] = previous_deg[wrap_down]
+    step[wrap_down] = 1
+
+    # Number of interpolated degrees between each pair of path points,
+    # i.e. len(range(start_range, end_range, step))
+    counts = np.maximum((end_range - start_range) * step, 0)
+    if len(counts) == 0 or counts.sum() == 0:
+        return np.zeros((0, 3)), np.zeros((0, 3, 3))
+
+    group_starts = np.cumsum(counts) - counts
+    offsets = np.arange(counts.sum()) - np.repeat(group_starts, counts)
+    angle_deg = np.repeat(start_range, counts) + offsets * np.repeat(step, counts)
+    angle_rad = angle_deg.astype(np.float64) / 180 * pi
+
+    positions = np.repeat(camera_path[1:], counts, axis=0)
+    return positions, heading_orientations(angle_rad)
+
+
+# Default speeds of the camera along resampled paths, in world units and degrees per second
+CAMERA_SPEED = 400.0
+TURN_SPEED = 45.0
+
+
+@timed('resample_camera_path')
+def resample_camera_path(camera_path, camera_angles, num_frames=None, camera_speed=CAMERA_SPEED,
+                         turn_speed=TURN_SPEED, fps=VIDEO_FPS):
+    """
+    Resample a path so that the camera moves and turns at a steady pace, unlike
+    smoothen_camera whose number of frames depends on the spacing of the path points.
+
+    Going from one path point to the next takes as long as moving at camera_speed
+    or turning at turn_speed, whichever is slower. The frames are then spread
+    evenly over the time the whole path takes, with the positions and headings
+    interpolated in between path points.
+
+    :param camera_path: array of shape (N, 3) of the path points
+    :param camera_angles: array of shape (N,) of the headings in degrees
+    :param num_frames: number of frames. By default, as many as the path takes at fps
+    :return: (positions, orientations) as arrays of shape (M, 3) and (M, 3, 3)
+    :raise ValueError: if the path takes more than MAX_FRAMES at fps
+    """
+    camera_path = np.asarray(camera_path, np.float64).reshape(-1, 3)
+    if len(camera_path) == 0 or num_frames == 0:
+        return np.zeros((0, 3)), np.zeros((0, 3, 3))
+
+    # Turn the shortest way around between consecutive headings
+    headings = np.degrees(np.unwrap(np.radians(np.asarray(camera_angles, np.float64))))
+    distances = np.sqrt(np.sum(np.diff(camera_path, axis=0) ** 2, axis=1))
+    step_times = np.maximum(distances / camera_speed, np.abs(np.diff(headings)) / turn_speed)
+    times = np.concatenate([[0], np.cumsum(step_times)])
+
+    if num_frames is None:
+        # Also false for an infinite time, at a speed too slow for floats
+        if not times[-1] * fps <= MAX_FRAMES:
+            raise ValueError('The camera takes more than %d frames along the path' % MAX_FRAMES)
+        num_frames = max(int(round(times[-1] * fps)), 1)
+    frame_times = np.linspace(0, times[-1], num_frames)
+
+    positions = np.column_stack([np.interp(frame_times, times, camera_path[:, axis]) for axis in range(3)])
+    angle_rad = np.radians(np.interp(frame_times, times, headings))
+    return positions, heading_orientations(angle_rad)
+
+
+def heading_orientations(angle_rad):
+    """
+    :param angle_rad: array of shape (N,) of headings in radians, in the horizontal plane
+    :return: array of shape (N, 3, 3) of the orientations of a level camera facing these headings
+    """
+    # The optical axis is (cos, sin, 0) and the vertical axis is (0, 0, -1), hence
+    # the horizontal axis, their cross product, is (sin, -cos, 0)
+    cos_angle, sin_angle = np.cos(angle_rad), np.sin(angle_rad)
+    orientations = np.zeros((len(angle_rad), 3, 3))
+    orientations[:, 0, 0] = sin_angle
+    orientations[:, 0, 1] = -cos_angle
+    orientations[:, 1, 2] = -1
+    orientations[:, 2, 0] = cos_angle
+    orientations[:, 2, 1] = sin_angle
+    return orientations
@@ -47,6 +47,55 @@ class Reconstructor(object):
         ratio = depth / self.focus
         return pixel[0]*ratio, pixel[1]*ratio, depth
 
+    def calculate3DCoordinates(self, pixels, depths, dtype=np.float32):
+        """
+        Calculate the 3D Coordinates of many pixels at once, as calculate3DCoordinate does
+        for each of them.
+        @param:
+            pixels: an array of shape (N,2) of the pixels, each as in calculate3DCoordinate
+            depths: an array of shape (N,) of the depths of the pixels
+            dtype: (Optional) the type of the coordinates, float32 to bound memory
+        @return:
+            an array of shape (N,3) of the 3D coordinates of the pixels
+        """
+        pixels = np.asarray(pixels)
+        depths = np.asarray(depths, dtype)
+        assert pixels.ndim == 2 and pixels.shape[1] == 2 and depths.shape == pixels.shape[:1]
+
+        # Convert the pixels to the virtual plane, in meters, and scale them by similar triangles
+        ratios = depths / dtype(self.focus * self.resolution)
+        coordinates = np.empty((len(pixels), 3), dtype)
+        coordinates[:, 0] = (pixels[:, 1] - self.size[1] / 2) * ratios
+        coordinates[:, 1] = (self.size[0] / 2 - pixels[:, 0]) * ratios
+        coordinates[:, 2] = depths
+        return coordinates
+
+    def reconstructDepthMap(self, depthMap, dtype=np.float32):
+        """
+        Calculate the 3D Coordinate of every pixel of the image in one pass
+        @param:
+            depthMap: an array of shape (Height, Width) of the depth of every pixel
+            dtype: (Optional) the type of the coordinates, float32 to bound memory
+        @return:
+            an array of shape (Height, Width, 3) where the element at [i, j] is the
+        3D coordinate of the pixel (i, j), as calculate3DCoordinate((i, j), depthMap[i, j])
+        """
+        depthMap = np.asarray(depthMap, dtype)
+        height, width = depthMap.shape
+        assert (height, width) == tuple(self.size[:2])
+
+        # The virtual plane coordinates only depend on the column (x) or the row (y),
+        # so they are broadcast instead of being stored for every pixel
+        columns = np.arange(width, dtype=dtype) - dtype(self.size[1] / 2)
+        rows = dtype(self.size[0] / 2) - np.arange(height, dtype=dtype)
+        ratios = depthMap / dtype(self.focus * self.resolution)
+
+        coordinates = np.empty((height, width, 3), dtype)
+        np.multiply(columns[np.newaxis, :], ratios, out=coordinates[:, :, 0])
+        np.multiply(rows[:, np.newaxis], ratios, out=coordinates[:, :, 1])
+        coordinates[:, :, 2] = depthMap
+        return coordinates
+
     def convertToVirtualPlane(self, pixel):
         """
         Convert the pixel from image coordinate to virtual plane coordinate
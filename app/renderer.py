@@ -0,0 +1,220 @@
+from collections import deque
+from multiprocessing import Pool, Value
+
+from camera import RenderTarget, FRAME_QUEUE_SIZE, VIDEO_FPS
+from planner import plan_path, render_planned_frame, POSE_TOLERANCE
+from segments import encode_segment
+import metrics
+
+
+# Seconds between 2 progress reports while waiting for the workers' segments
+PROGRESS_INTERVAL = 0.1
+
+# Each worker process keeps its own copy of the camera and the surfaces. They
+# are handed over once through the pool initializer so the surface textures are
+# shipped to a worker a single time instead of along with every frame.
+_worker_camera = None
+_worker_surfaces = None
+_worker_target = None
+_worker_frames_rendered = None  # shared count of the frames rendered by all the workers
+
+
+def _init_worker(camera, surfaces, frames_rendered=None):
+    global _worker_camera, _worker_surfaces, _worker_target, _worker_frames_rendered
+    _worker_camera = camera
+    _worker_surfaces = surfaces
+    _worker_target = RenderTarget(camera.width, camera.height)
+    _worker_frames_rendered = frames_rendered
+
+
+def _render_chunk(plan):
+    # The metrics recorded by the worker are sent back along with the frames
+    with metrics.collecting() as chunk_metrics:
+        frames = list(render_frames(_worker_camera, _worker_surfaces, plan, _worker_target))
+    return frames, chunk_metrics.snapshot()
+
+
+def _render_segment(plan, file_path, fps, encoding):
+    with metrics.collecting() as segment_metrics:
+        frames = render_frames(_worker_camera, _worker_surfaces, plan, _worker_target)
+        if _worker_frames_rendered is not None:
+            frames = _count_frames(frames, _worker_frames_rendered)
+        encode_segment(_worker_camera.width, _worker_camera.height, frames, file_path, fps=fps, encoding=encoding)
+    return segment_metrics.snapshot()
+
+
+def _count_frames(frames, frames_rendered):
+    for frame in frames:
+        with frames_rendered.get_lock():
+            frames_rendered.value += 1
+        yield frame
+
+
+def _report_frames(frames, progress, frames_done=0):
+    """
+    Call progress with the number of frames rendered so far, frames_done
+    included, after each frame and before it is handed over
+    """
+    for frame in frames:
+        frames_done += 1
+        progress(frames_done)
+        yield frame
+
+
+def render_frames(camera, surfaces, plan, target):
+    """
+    Render the frames of a plan in order, reusing the previous frame where the pose repeats.
+
+    :return: a generator yielding the frames. The frames outlive the render
+    target's next use, e.g. while queued for encoding, and a reused frame is
+    the same array as the frame before it
+    """
+    frame = None
+    for index in xrange(len(plan)):
+        if frame is not None and plan.repeats[index]:
+            metrics.increment('frames_skipped')
+        else:
+            frame = render_planned_frame(camera, surfaces, plan, index, target).copy()
+        yield frame
+
+
+class FrameRenderer(object):
+    """
+    Render the frames of a camera path through a space, optionally sharding
+    the path across a pool of worker processes.
+
+    Rendering happens in 2 stages. The whole path is planned up front, which
+    works out the visible surfaces and their homographies for every frame at
+    once. The frames are then rendered from the plan, which only warps textures.
+    """
+
+    def __init__(self, camera, space, workers=1, chunk_size=8, pose_tolerance=POSE_TOLERANCE):
+        """
+        :param camera: the camera used to render. Its width, height and focal
+        length are used, its position and orientation are overwritten per frame
+        :param space: the space to render
+        :param workers: number of worker processes. 1 or less renders serially
+        in the current process, which is handy for debugging
+        :param chunk_size: number of consecutive frames handed to a worker at once
+        :param pose_tolerance: largest difference between the poses of consecutive
+        frames for the previous frame to be reused. None renders every frame
+        """
+        self.camera = camera
+        self.space = space
+        self.surfaces = space.surfaces()
+        self.render_target = RenderTarget(camera.width, camera.height)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.pose_tolerance = pose_tolerance
+
+    def plan(self, positions, orientations):
+        """
+        :param positions: sequence of camera positions
+        :param orientations: sequence of camera orientation matrices
+        :return: the RenderPlan of the path
+        """
+        return plan_path(self.camera, self.surfaces, positions, orientations, self.pose_tolerance)
+
+    def render(self, positions, orientations):
+        """
+        Render one frame per (position, orientation) pair.
+
+        :param positions: sequence of camera positions
+        :param orientations: sequence of camera orientation matrices
+        :return: a generator yielding the frames in path order
+        """
+        return self.render_plan(self.plan(positions, orientations))
+
+    def render_plan(self, plan):
+        """
+        :return: a generator yielding the frames of the plan in order
+        """
+        if self.workers <= 1 or len(plan) <= 1:
+            return self._render_serial(plan)
+        return self._render_parallel(plan)
+
+    def _render_serial(self, plan):
+        return render_frames(self.camera, self.surfaces, plan, self.render_target)
+
+    def _render_parallel(self, plan):
+        # Only a couple of chunks per worker are in flight at any time so that
+        # memory stays bounded when frames are consumed slower than rendered.
+        max_pending = 2 * self.workers
+        pool = Pool(self.workers, _init_worker, (self.camera, self.surfaces))
+        pending = deque()
+        try:
+            for start in xrange(0, len(plan), self.chunk_size):
+                chunk = plan[start:start + self.chunk_size]
+                pending.append(pool.apply_async(_render_chunk, (chunk,)))
+                if len(pending) >= max_pending:
+                    for frame in self._collect_chunk(pending.popleft()):
+                        yield frame
+            while pending:
+                for frame in self._collect_chunk(pending.popleft()):
+                    yield frame
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _collect_chunk(self, result):
+        frames, chunk_metrics = result.get()
+        metrics.merge(chunk_metrics)
+        return frames
+
+    def render_segments(self, plan, segments, queue_size=FRAME_QUEUE_SIZE, fps=VIDEO_FPS, encoding=None,
+                        progress=None):
+        """
+        Render frame ranges of the plan and encode each into its own video file.
+        With several workers, each worker renders and encodes whole segments.
+
+        :param segments: list of (index, start, end, file_path) of the segments, see SegmentManifest
+        :param queue_size: see generate_video. Only used when rendering serially
+        :param fps: frame rate of the videos
+        :param encoding: the encoder and its settings, see open_encoder
+        :param progress: (optional) function called with the number of frames
+        rendered so far, after every frame. With workers, it is called every
+        PROGRESS_INTERVAL seconds while waiting for them instead. An exception
+        it raises, e.g. to cancel, stops rendering
+        :return: a generator yielding the segments as they are encoded, in order
+        """
+        if self.workers <= 1 or len(segments) <= 1:
+            frames_done = 0
+            for segment in segments:
+                _, start, end, file_path = segment
+                frames = render_frames(self.camera, self.surfaces, plan[start:end], self.render_target)
+                if progress is not None:
+                    frames = _report_frames(frames, progress, frames_done)
+                encode_segment(self.camera.width, self.camera.height, frames, file_path, queue_size, fps, encoding)
+                frames_done += end - start
+                yield segment
+            return
+
+        frames_rendered = Value('l', 0)
+        pool = Pool(self.workers, _init_worker, (self.camera, self.surfaces, frames_rendered))
+        pending = deque()
+        try:
+            for segment in segments:
+                _, start, end, file_path = segment
+                pending.append((segment, pool.apply_async(_render_segment,
+                                                          (plan[start:end], file_path, fps, encoding))))
+                if len(pending) >= 2 * self.workers:
+                    yield self._collect_segment(pending.popleft(), progress, frames_rendered)
+            while pending:
+                yield self._collect_segment(pending.popleft(), progress, frames_rendered)
+            pool.close()
+        finally:
+            # Also stops the workers right away when progress raised
+            pool.terminate()
+            pool.join()
+
+    def _collect_segment(self, pending_segment, progress, frames_rendered):
+        segment, result = pending_segment
+        if progress is not None:
+            while not result.ready():
+                result.wait(PROGRESS_INTERVAL)
+                progress(frames_rendered.value)
+        metrics.merge(result.get())
+        if progress is not None:
+            progress(frames_rendered.value)
+        return segment
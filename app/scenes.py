@@ -0,0 +1,53 @@
+import json
+import os
+import re
+import tempfile
+import uuid
+
+from surface import Space
+from textures import texture_store
+
+
+# Where registered scenes are saved, see save_scene
+SCENE_STORE_PATH = os.environ.get('SCENE_STORE_PATH', os.path.join(tempfile.gettempdir(), 'scenes'))
+
+SCENE_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def save_scene(space, world, path=SCENE_STORE_PATH):
+    """
+    Save a space along with the dimensions of its world so that many camera
+    paths can be rendered through it without setting it up again. Its textures
+    are pinned in the texture store, so they are never evicted.
+
+    :param world: dict of the world's 'width', 'height' and 'depth'
+    :return: the id of the scene
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    scene_id = uuid.uuid4().hex
+    space.save(_scene_file(path, scene_id, 'npy'))
+    texture_store().pin(surface.texture_handle[1] for surface in space.surfaces())
+    with open(_scene_file(path, scene_id, 'json'), 'w') as world_file:
+        json.dump({'world': world}, world_file)
+    return scene_id
+
+
+def load_scene(scene_id, path=SCENE_STORE_PATH):
+    """
+    :return: (space, world) of the scene saved by save_scene,
+    or (None, None) if there is no such scene
+    """
+    if not SCENE_ID_PATTERN.match(scene_id) or not os.path.exists(_scene_file(path, scene_id, 'json')):
+        return None, None
+    with open(_scene_file(path, scene_id, 'json')) as world_file:
+        world = json.load(world_file)['world']
+    return Space.load(_scene_file(path, scene_id, 'npy')), world
+
+
+def scene_exists(scene_id, path=SCENE_STORE_PATH):
+    return bool(SCENE_ID_PATTERN.match(scene_id)) and os.path.exists(_scene_file(path, scene_id, 'json'))
+
+
+def _scene_file(path, scene_id, extension):
+    return os.path.join(path, '%s.%s' % (scene_id, extension))
@@ -0,0 +1,149 @@
+import json
+import os
+import subprocess
+import tempfile
+import threading
+from distutils.spawn import find_executable
+
+import cv2 as cv2
+
+from camera import write_video, VIDEO_FPS
+from metrics import timed
+
+
+# Number of frames encoded into each segment of a video
+SEGMENT_LENGTH = int(os.environ.get('SEGMENT_LENGTH', 100))
+
+# Where the segments of the videos being rendered are kept until they are concatenated
+SEGMENTS_PATH = os.environ.get('SEGMENTS_PATH', os.path.join(tempfile.gettempdir(), 'segments'))
+
+MANIFEST_FILE_NAME = 'manifest.json'
+
+
+class SegmentManifest(object):
+    """
+    The segments a video is split into, each a contiguous range of frames
+    encoded into its own file, and which of them are already encoded. The
+    manifest is saved along with the segments, so rendering the same video into
+    the same directory again only renders the segments that are missing.
+    """
+
+    def __init__(self, directory, num_of_frames, segment_length=SEGMENT_LENGTH):
+        self.directory = directory
+        self.num_of_frames = num_of_frames
+        self.segment_length = segment_length
+        self.completed = set()
+
+        manifest = self._load()
+        if manifest is not None and (manifest['num_of_frames'], manifest['segment_length']) == \
+                (num_of_frames, segment_length):
+            # Only trust the segments whose file made it to disk
+            self.completed = set(index for index in manifest['completed']
+                                 if os.path.exists(self.segment_path(index)))
+
+    def segments(self):
+        """
+        :return: list of (index, start, end, file_path) of all the segments, in order
+        """
+        return [(index, start, min(start + self.segment_length, self.num_of_frames), self.segment_path(index))
+                for index, start in enumerate(xrange(0, self.num_of_frames, self.segment_length))]
+
+    def pending(self):
+        """
+        :return: the segments left to encode, as in segments
+        """
+        return [segment for segment in self.segments() if segment[0] not in self.completed]
+
+    def completed_frames(self):
+        return sum(end - start for index, start, end, _ in self.segments() if index in self.completed)
+
+    def complete(self, index):
+        self.completed.add(index)
+        self._save()
+
+    def segment_path(self, index):
+        return os.path.join(self.directory, 'segment_%05d.mp4' % index)
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST_FILE_NAME)) as manifest_file:
+                return json.load(manifest_file)
+        except (IOError, ValueError):
+            return None
+
+    def _save(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        manifest_path = os.path.join(self.directory, MANIFEST_FILE_NAME)
+        # Write to a temporary file first so that a crash never leaves a partial manifest
+        temp_path = '%s.%d.%d.tmp' % (manifest_path, os.getpid(), threading.current_thread().ident)
+        with open(temp_path, 'w') as manifest_file:
+            json.dump({'num_of_frames': self.num_of_frames, 'segment_length': self.segment_length,
+                       'completed': sorted(self.completed)}, manifest_file)
+        os.rename(temp_path, manifest_path)
+
+
+@timed('encode_segment')
+def encode_segment(width, height, frames, file_path, queue_size=0, fps=VIDEO_FPS, encoding=None):
+    """
+    Encode the frames of a segment. The file only appears once complete, so a
+    segment interrupted half-way is encoded again from its first frame.
+
+    :param encoding: the encoder and its settings, see open_encoder
+    """
+    directory = os.path.dirname(file_path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Created by another worker in the meantime
+            pass
+    # Named after the process and thread, in case the same video is rendered twice at once
+    temp_path = '%s.%d.%d.part.mp4' % (file_path[:-len('.mp4')], os.getpid(), threading.current_thread().ident)
+    try:
+        write_video(width, height, frames, temp_path, queue_size, fps, encoding)
+    except:
+        # Cancelled or failed, nothing would ever pick up the partial file
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.rename(temp_path, file_path)
+
+
+@timed('concatenate_videos')
+def concatenate_videos(width, height, file_paths, file_path, fps=VIDEO_FPS, encoding=None):
+    """
+    Concatenate videos of the given size into one. FFmpeg copies the encoded
+    streams as they are if it is installed, with the index up front so that
+    browsers start playing before the end, otherwise the videos are decoded
+    and encoded again.
+
+    :param encoding: the encoder and its settings of the videos, see open_encoder
+    """
+    ffmpeg = find_executable('ffmpeg')
+    if ffmpeg is not None:
+        list_path = file_path + '.txt'
+        with open(list_path, 'w') as list_file:
+            for path in file_paths:
+                list_file.write("file '%s'\n" % os.path.abspath(path).replace("'", "'\\''"))
+        try:
+            subprocess.check_call([ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                                   '-i', list_path, '-c', 'copy', '-movflags', '+faststart', file_path])
+        finally:
+            os.remove(list_path)
+        return
+
+    write_video(width, height, _decode_videos(file_paths), file_path, queue_size=0, fps=fps, encoding=encoding)
+
+
+def _decode_videos(file_paths):
+    for path in file_paths:
+        capture = cv2.VideoCapture(path)
+        try:
+            while True:
+                success, frame = capture.read()
+                if not success:
+                    break
+                yield frame
+        finally:
+            capture.release()
@@ -18,11 +18,13 @@ var POINT_LABEL_FONT_WEIGHT = 'bold';
 
 var CAMERA_DEFAULT_HEIGHT = 40;
 
+var RENDER_JOB_POLL_INTERVAL = 1000;
+
 angular.module('CameraApp', []).config(function ($interpolateProvider) {
   $interpolateProvider.startSymbol('[[').endSymbol(']]');
 });
 
-function CameraController ($scope, $http) {
+function CameraController ($scope, $http, $timeout) {
   var images = {
     cmu: {
       image: 'cmu.jpg',
@@ -185,23 +187,62 @@ function CameraController ($scope, $http) {
         x: parseInt($scope.vanishingPoint.left/scale),
         y: parseInt($scope.vanishingPoint.top/scale),
       },
-      image: $scope.selectedImage.image
+      image: $scope.selectedImage.image,
+      preview: true
     }).success(function (res, status, headers, config) {
-      if (res.status === 'success') {
+      if (res.status === 'done') {
+        // Rendered before
         $scope.renderingVideo = false;
-        var video = res.video;
-        var $videoPlayer = $('.video-player');
-        $videoPlayer.width(video.width);
-        $videoPlayer.height(video.height);
-        $videoPlayer.attr('src', video.src);
-        $('#video-modal').modal();
+        showVideo(res.video);
+        return;
       }
+      // Show the preview first, then swap in the full video once rendered
+      pollRenderJob(res.job.id, function () {
+        pollRenderJob(res.upgrade.id);
+      });
     }).error(function (res, status, headers, config) {
       alert('Rendering failed');
       $scope.renderingVideo = false;
     });
   }
 
+  $scope.renderProgress = null;
+
+  function pollRenderJob (jobId, onDone) {
+    $http.get('/jobs/' + jobId).success(function (job, status, headers, config) {
+      $scope.renderProgress = job.progress;
+      if (job.status === 'queued' || job.status === 'running') {
+        $timeout(function () {
+          pollRenderJob(jobId, onDone);
+        }, RENDER_JOB_POLL_INTERVAL);
+        return;
+      }
+
+      $scope.renderingVideo = job.status === 'done' && !!onDone;
+      $scope.renderProgress = null;
+      if (job.status === 'done') {
+        showVideo(job.result);
+        if (onDone) {
+          onDone();
+        }
+      } else if (job.status === 'failed') {
+        alert('Rendering failed');
+      }
+    }).error(function (res, status, headers, config) {
+      alert('Rendering failed');
+      $scope.renderingVideo = false;
+      $scope.renderProgress = null;
+    });
+  }
+
+  function showVideo (video) {
+    var $videoPlayer = $('.video-player');
+    $videoPlayer.width(video.width);
+    $videoPlayer.height(video.height);
+    $videoPlayer.attr('src', video.src);
+    $('#video-modal').modal('show');
+  }
+
   $scope.getRenderVideoButtonState = function () {
     var pathObject = planViewCanvas.getActiveObject();
     return pathObject && pathObject !== boundaryRect && pathObject.path;
@@ -1,8 +1,13 @@
+import os
+import threading
 import numpy as np
+import cv2 as cv2
+
+from textures import texture_store
 
 
 class Surface(object):
-    def __init__(self, image, edge_points3d, edge_points2d):
+    def __init__(self, image, edge_points3d, edge_points2d, normal=None):
         """
         Constructor for a surface defined by a texture image and
         4 boundary points. Choose the first point as the origin
@@ -11,13 +16,73 @@ class Surface(object):
         :param image: image array
         :param edge_points3d: array of 3d coordinates of 4 corner points in clockwise direction
         :param edge_points2d: array of 2d coordinates of 4 corner points in clockwise direction
+        :param normal: (optional) the precomputed normal vector, see _get_normal_vector
         """
         assert len(edge_points3d) == 4 and len(edge_points2d) == 4
 
         self.image = image
         self.edge_points3d = edge_points3d
         self.edge_points2d = np.float32(edge_points2d)  # This is required for using cv2's getPerspectiveTransform
-        self.normal = self._get_normal_vector()
+        self.normal = normal if normal is not None else self._get_normal_vector()
+        edges2d = self.edge_points2d[[1, 2, 3, 0]] - self.edge_points2d
+        self.edge_lengths2d = np.sqrt(np.sum(edges2d ** 2, axis=1))
+        self._mipmaps = [image]  # the texture pyramid, built lazily
+        self._mipmaps_lock = threading.Lock()
+        self.texture_handle = None  # (store path, key) once the texture is in a TextureStore
+
+    def share_texture(self, store=None):
+        """
+        Move the texture into a TextureStore. The surface then refers to a
+        read-only memory-mapped texture and is pickled with the texture's handle
+        instead of its data, e.g. when sent to a render worker.
+
+        :param store: the TextureStore, the default store of the process by default
+        :return: the surface
+        """
+        store = store if store is not None else texture_store()
+        key, self.image = store.share(self.image)
+        self.texture_handle = (store.path, key)
+        self._mipmaps = [self.image]
+        return self
+
+    def mipmap(self, level):
+        """
+        :param level: level in the texture pyramid, 0 being the texture itself.
+        Each level is half the size of the previous one
+        :return: (image, level) the image of the level, or of the smallest level
+        if the texture can't be halved that many times
+        """
+        mipmaps = self._mipmaps
+        if len(mipmaps) <= level:
+            # Render threads share the surface and pyrDown releases the GIL, so the
+            # missing levels are built by one thread and published all at once
+            with self._mipmaps_lock:
+                mipmaps = list(self._mipmaps)
+                while len(mipmaps) <= level:
+                    height, width = mipmaps[-1].shape[:2]
+                    if min(height, width) <= 1:
+                        break
+                    mipmaps.append(cv2.pyrDown(mipmaps[-1]))
+                self._mipmaps = mipmaps
+        level = min(level, len(mipmaps) - 1)
+        return mipmaps[level], level
+
+    def __getstate__(self):
+        # Mipmaps are cheap to rebuild, don't ship them along with the surface
+        state = dict(self.__dict__)
+        if self.texture_handle is not None:
+            state['image'] = None
+        state['_mipmaps'] = []
+        del state['_mipmaps_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.texture_handle is not None:
+            path, key = self.texture_handle
+            self.image = texture_store(path).get(key)
+        self._mipmaps = [self.image]
+        self._mipmaps_lock = threading.Lock()
 
     def top_left_corner3d(self):
         return self.edge_points3d[0]
@@ -56,6 +121,14 @@ class Polyhedron(object):
         self.surfaces = surfaces
 
 
+# A saved space has one record per surface
+SPACE_DTYPE = np.dtype([('model', np.int32),
+                        ('edge_points3d', np.float64, (4, 3)),
+                        ('edge_points2d', np.float32, (4, 2)),
+                        ('normal', np.float64, (3,)),
+                        ('texture', 'S40')])  # key of the texture in the TextureStore
+
+
 class Space(object):
     def __init__(self, models=None):
         self.models = models or []
@@ -64,6 +137,51 @@ class Space(object):
         assert isinstance(model, Polyhedron)
         self.models.append(model)
 
+    def surfaces(self):
+        surfaces = []
+        for model in self.models:
+            surfaces.extend(model.surfaces)
+        return surfaces
+
+    def save(self, file_path, store=None):
+        """
+        Save the space as a .npy file of SPACE_DTYPE records. The textures are
+        not part of the file, they are shared in a TextureStore and referenced by key.
+
+        :param store: the TextureStore, the default store of the process by default
+        """
+        store = store if store is not None else texture_store()
+        records = []
+        for index, model in enumerate(self.models):
+            for surface in model.surfaces:
+                if surface.texture_handle is None or surface.texture_handle[0] != store.path:
+                    surface.share_texture(store)
+                records.append((index, surface.edge_points3d, surface.edge_points2d, surface.normal,
+                                surface.texture_handle[1]))
+
+        # Write to a temporary file first so that readers never see a partial space
+        temp_path = '%s.tmp' % file_path
+        with open(temp_path, 'wb') as temp_file:
+            np.save(temp_file, np.array(records, SPACE_DTYPE))
+        os.rename(temp_path, file_path)
+
+    @staticmethod
+    def load(file_path, store=None):
+        """
+        Load a space saved by Space.save. The textures are memory-mapped from the store.
+
+        :param store: the TextureStore the space was saved with
+        """
+        store = store if store is not None else texture_store()
+        records = np.load(file_path, mmap_mode='r')
+        models = [[] for _ in xrange(records['model'].max() + 1 if len(records) else 0)]
+        for record in records:
+            surface = Surface(store.get(record['texture']), np.array(record['edge_points3d']),
+                              record['edge_points2d'], np.array(record['normal']))
+            surface.texture_handle = (store.path, record['texture'])
+            models[record['model']].append(surface)
+        return Space([Polyhedron(surfaces) for surfaces in models])
+
 
 class Line2D(object):
     def __init__(self, point1, point2):
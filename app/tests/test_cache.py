@@ -0,0 +1,95 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import app.cut_image as cut_image
+from app.cache import LRUCache
+
+
+class TestLRUCache(TestCase):
+    def setUp(self):
+        self.cache = LRUCache(10)
+
+    def testPut_evictsLeastRecentlyUsedValues(self):
+        self.cache.put('a', 'xxxx')
+        self.cache.put('b', 'xxxx')
+        self.assertEqual(self.cache.get('a'), 'xxxx')
+
+        # 'b' is now the least recently used
+        self.cache.put('c', 'xxxx')
+
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+        self.assertIn('c', self.cache)
+        self.assertEqual(self.cache.size, 8)
+
+    def testPut_replacesValue(self):
+        self.cache.put('a', 'xxxx')
+        self.cache.put('a', 'xx')
+
+        self.assertEqual(self.cache.get('a'), 'xx')
+        self.assertEqual(self.cache.size, 2)
+
+    def testPut_skipsOversizeValue(self):
+        self.cache.put('a', 'xxxx')
+        self.cache.put('b', 'x' * 11)
+
+        # The value doesn't fit, and it doesn't evict the others either
+        self.assertNotIn('b', self.cache)
+        self.assertIn('a', self.cache)
+        self.assertEqual(self.cache.size, 4)
+
+    def testGet_countsHitsAndMisses(self):
+        self.cache.put('a', 'x')
+
+        self.assertEqual(self.cache.get('a'), 'x')
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def testSizeOf_bytesOfImages(self):
+        cache = LRUCache(1000, size_of=lambda image: image.nbytes)
+        cache.put('a', np.zeros((10, 10, 3), np.uint8))
+        cache.put('b', np.zeros((10, 10, 3), np.uint8))
+        cache.put('c', np.zeros((10, 10, 3), np.uint8))
+        cache.put('d', np.zeros((10, 10, 3), np.uint8))
+
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.size, 900)
+
+
+class TestSliceCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.slice_cache_path = cut_image.SLICE_CACHE_PATH
+        cut_image.SLICE_CACHE_PATH = os.path.join(self.directory, 'slices')
+
+    def tearDown(self):
+        cut_image.SLICE_CACHE_PATH = self.slice_cache_path
+        shutil.rmtree(self.directory)
+
+    def testSavedTextures_loadedBack(self):
+        textures = [('front', np.arange(24, dtype=np.uint8).reshape((2, 4, 3))),
+                    ('left', np.ones((3, 2, 3), np.uint8))]
+
+        cut_image.save_cached_textures('a' * 40, textures)
+        loaded = cut_image.load_cached_textures('a' * 40)
+
+        self.assertListEqual([name for name, _ in loaded], ['front', 'left'])
+        for (_, texture), (_, loaded_texture) in zip(textures, loaded):
+            self.assertTrue(np.array_equal(texture, loaded_texture))
+        self.assertListEqual(os.listdir(cut_image.SLICE_CACHE_PATH), ['a' * 40 + '.npz'])
+
+    def testLoadCachedTextures_missing(self):
+        self.assertIsNone(cut_image.load_cached_textures('b' * 40))
+
+    def testWithoutSliceCachePath_nothingIsSaved(self):
+        cut_image.SLICE_CACHE_PATH = None
+
+        cut_image.save_cached_textures('a' * 40, [('front', np.ones((2, 2, 3), np.uint8))])
+
+        self.assertIsNone(cut_image.load_cached_textures('a' * 40))
+        self.assertListEqual(os.listdir(self.directory), [])
@@ -2,7 +2,8 @@ from unittest import TestCase
 import numpy as np
 import cv2 as cv2
 from app.surface import Surface
-from app.camera import Camera
+from app.camera import Camera, COMPOSITE_DEPTH
+from app.textures import load_texture
 
 
 SIZE = 100.0
@@ -13,7 +14,7 @@ class TestCamera(TestCase):
         self.camera = Camera(50, width=200, height=200)
         self.camera.position = np.array([0, -20, 0])
 
-        self.image = cv2.imread('../static/cube/front.png', cv2.CV_LOAD_IMAGE_COLOR)
+        self.image = load_texture('../static/cube/front.png')
         self.edge_2dpoints = edge_2dpoints = np.array([(0, 0), (200, 0), (200, 200), (0, 200)])
 
     def tearDown(self):
@@ -121,3 +122,71 @@ class TestCamera(TestCase):
         clipped_height, clipped_width, _ = clipped_image.shape
         self.assertAlmostEqual(clipped_height, 200)
         self.assertAlmostEqual(clipped_width, 200)
+
+    def testProjectSurfaces_depthCompositing_closerSurfaceWins(self):
+        near_surface = Surface(self.image, np.array([(-5, 0, 5), (5, 0, 5), (5, 0, -5), (-5, 0, -5)]),
+                               self.edge_2dpoints)
+        far_surface = Surface(255 - self.image, np.array([(-20, 10, 20), (20, 10, 20), (20, 10, -20), (-20, 10, -20)]),
+                              self.edge_2dpoints)
+        self.camera.compositing = COMPOSITE_DEPTH
+
+        near_image = self.camera.project_surface(near_surface)
+        near_first = self.camera.project_surfaces([near_surface, far_surface])
+        far_first = self.camera.project_surfaces([far_surface, near_surface])
+
+        covered = near_image.any(axis=2)
+        self.assertTrue(np.array_equal(near_first, far_first))
+        self.assertTrue(np.array_equal(near_first[covered], near_image[covered]))
+
+    def testProjectPoints_matchesPointProjection(self):
+        points = np.array([(10, 30, 5), (-10, 30, -5), (0, 80, 0)])
+
+        projected_points = self.camera.project_points(points)
+
+        self.assertEqual(projected_points.shape, (3, 2))
+        self.assertTrue(np.allclose(projected_points, [(10, -5), (-10, 5), (0, 0)]))
+        for point, projected_point in zip(points, projected_points):
+            self.assertTrue(np.allclose(self.camera.point_projection(point), projected_point))
+
+    def testProjectPoints_stackOfCameraPoses(self):
+        points = np.array([(10, 30, 5), (-10, 30, -5)])
+        positions = np.array([(0, -20, 0), (0, 5, 0)])
+        orientations = np.array([self.camera.orientation, self.camera.orientation])
+
+        projected_points = self.camera.project_points(points, positions, orientations)
+
+        self.assertEqual(projected_points.shape, (2, 2, 2))
+        self.assertTrue(np.allclose(projected_points[0], [(10, -5), (-10, 5)]))
+        self.assertTrue(np.allclose(projected_points[1], [(20, -10), (-20, 10)]))
+
+
+    def testProjectSurfaceRegion_onlyCoversProjectedSurface(self):
+        edge_3dpoints = np.array([(-5, 0, 5), (5, 0, 5), (5, 0, -5), (-5, 0, -5)])
+        surface = Surface(self.image, edge_3dpoints, self.edge_2dpoints)
+
+        projected_image, offset = self.camera.project_surface_region(surface)
+
+        self.assertEqual(offset, (87, 87))
+        self.assertEqual(projected_image.shape, (27, 27, 3))
+
+    def testProjectSurfaceRegion_offScreenSurface_notProjected(self):
+        edge_3dpoints = np.array([(995, 0, 5), (1005, 0, 5), (1005, 0, -5), (995, 0, -5)])
+        surface = Surface(self.image, edge_3dpoints, self.edge_2dpoints)
+
+        projected_image, offset = self.camera.project_surface_region(surface)
+
+        self.assertIsNone(projected_image)
+
+    def testProjectSurfaceRegion_distantSurface_warpedFromMipmap(self):
+        edge_3dpoints = np.array([(-5, 0, 5), (5, 0, 5), (5, 0, -5), (-5, 0, -5)])
+        surface = Surface(self.image, edge_3dpoints, self.edge_2dpoints)
+        full_resolution_camera = Camera(50, width=200, height=200, mipmapping=False)
+        full_resolution_camera.position = self.camera.position
+
+        projected_image, offset = self.camera.project_surface_region(surface)
+        expected_image, expected_offset = full_resolution_camera.project_surface_region(surface)
+
+        self.assertEqual(len(surface._mipmaps), 4)
+        self.assertEqual(offset, expected_offset)
+        self.assertEqual(projected_image.shape, expected_image.shape)
+        self.assertLess(np.mean(np.abs(np.int32(projected_image) - expected_image)), 10)
@@ -0,0 +1,85 @@
+from unittest import TestCase, skipIf
+from distutils.spawn import find_executable
+import shutil
+import tempfile
+
+import cv2 as cv2
+import numpy as np
+
+import app.encoders as encoders
+from app.encoders import encoding_options, open_encoder, FFmpegEncoder, OpenCVEncoder, VIDEO_ENCODER
+
+
+def count_frames(file_path):
+    capture = cv2.VideoCapture(file_path)
+    num_of_frames = 0
+    while capture.read()[0]:
+        num_of_frames += 1
+    capture.release()
+    return num_of_frames
+
+
+class TestEncoders(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.frames = [np.full((48, 64, 3), value, np.uint8) for value in range(0, 250, 25)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def encode(self, encoder):
+        try:
+            for frame in self.frames:
+                encoder.write(frame)
+        finally:
+            encoder.close()
+
+    def testEncodingOptions(self):
+        self.assertEqual(encoding_options(), {'encoder': VIDEO_ENCODER})
+        self.assertEqual(encoding_options({'encoder': 'ffmpeg', 'preset': 'ultrafast', 'crf': '30'}),
+                         {'encoder': 'ffmpeg', 'preset': 'ultrafast', 'crf': 30})
+
+    def testEncodingOptions_rejectsInvalidSettings(self):
+        self.assertRaises(ValueError, encoding_options, {'encoder': 'gstreamer'})
+        self.assertRaises(ValueError, encoding_options, {'bitrate': '1M'})
+        self.assertRaises(ValueError, encoding_options, {'preset': 'fast -f null'})
+        self.assertRaises(ValueError, encoding_options, {'crf': 'high'})
+        self.assertRaises(ValueError, encoding_options, {'crf': -1})
+        self.assertRaises(ValueError, encoding_options, {'codec': 'libx265', 'crf': 52})
+        self.assertRaises(ValueError, encoding_options, {'threads': -2})
+        self.assertEqual(encoding_options({'crf': '51', 'threads': '0'})['crf'], 51)
+        self.assertRaises(ValueError, open_encoder, 'video.mp4', 16, 16, 15, {'fourcc': 'h264x'})
+
+    @skipIf(find_executable('ffmpeg') is None, 'ffmpeg is not installed')
+    def testFFmpegEncoder(self):
+        file_path = self.directory + '/video.mp4'
+        encoder = open_encoder(file_path, 64, 48, 15, {'encoder': 'ffmpeg', 'preset': 'ultrafast'})
+        self.assertIsInstance(encoder, FFmpegEncoder)
+
+        self.encode(encoder)
+
+        self.assertEqual(count_frames(file_path), len(self.frames))
+
+    @skipIf(find_executable('ffmpeg') is None, 'ffmpeg is not installed')
+    def testFFmpegEncoder_reportsErrors(self):
+        encoder = FFmpegEncoder(self.directory + '/video.mp4', 64, 48, 15, codec='no_such_codec')
+
+        with self.assertRaises(IOError) as context:
+            self.encode(encoder)
+        self.assertIn('no_such_codec', str(context.exception))
+
+    def testOpenEncoder_fallsBackToOpenCV(self):
+        find_ffmpeg = encoders.find_executable
+        # An ffmpeg which can't be started
+        encoders.find_executable = lambda name: self.directory + '/ffmpeg'
+        try:
+            encoder = open_encoder(self.directory + '/video.mp4', 64, 48, 15, {'fourcc': 'mp4v'})
+            self.assertIsInstance(encoder, OpenCVEncoder)
+            self.encode(encoder)
+
+            self.assertRaises(OSError, open_encoder, self.directory + '/other.mp4', 64, 48, 15,
+                              {'encoder': 'ffmpeg'})
+        finally:
+            encoders.find_executable = find_ffmpeg
+
+        self.assertEqual(count_frames(self.directory + '/video.mp4'), len(self.frames))
@@ -1,4 +1,7 @@
 from unittest import TestCase
+
+import numpy as np
+
 from app.graham_scan import *
 
 
@@ -64,6 +67,37 @@ class TestGrahamScan(TestCase):
         self.__assertConvexHull(points)
         self.assertEqual(len(points), 4)
 
+    def test_GrahamScan_arrays(self):
+        # The depths of the corners are kept along
+        points = np.array([(5, 2, 1), (-1, 4, 2), (4, -2, 3), (1, 2, 4), (0, 0, 5), (-2, -5, 6)])
+        hull = calculateConvexHull(points)
+        self.assertTupleEqual(hull.shape, (4, 3))
+        self.assertListEqual(hull.tolist(), [[-2, -5, 6], [4, -2, 3], [5, 2, 1], [-1, 4, 2]])
+
+        # Of the points at the same position, the one of smallest depth is kept
+        points = np.array([(3, 0, 4), (0, 0, 1), (3, 0, 3), (0, 3, 2), (0, 3, 1)])
+        hull = calculateConvexHull(points)
+        self.assertListEqual(hull.tolist(), [[0, 0, 1], [3, 0, 3], [0, 3, 1]])
+
+        points = np.array([(3, 0, 4), (3, 0, 3)])
+        self.assertListEqual(calculateConvexHull(points).tolist(), [[3, 0, 3]])
+
+        points = np.random.RandomState(0).rand(2000, 2)
+        hull = calculateConvexHull(points)
+        self.__assertConvexHull(hull)
+        # Every point is on the left of, or on, every edge of the hull
+        for p, q in zip(hull, np.roll(hull, -1, axis=0)):
+            self.assertTrue(all(isCW(p, q, r) != -1 for r in points))
+
+    def test_GrahamScan_manyPointsOffTheHull(self):
+        # The points of a parabola turn right one after the other once the lowest point is below them
+        x = np.linspace(-1, 1, 3001)
+        points = np.vstack([np.column_stack([x, x ** 2]), [(0, -100)]])
+
+        hull = calculateConvexHull(points)
+
+        self.assertListEqual(hull.tolist(), [[-1, 1], [0, -100], [1, 1]])
+
     def __assertConvexHull(self, points):
         """
         Assert whether the points listed are in CW order
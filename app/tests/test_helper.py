@@ -0,0 +1,61 @@
+from unittest import TestCase
+import threading
+import time
+
+from app.helper import prefetch
+
+
+class TestPrefetch(TestCase):
+    def testPrefetch_yieldsItemsInOrder(self):
+        self.assertListEqual(list(prefetch(iter(range(20)), 3)), range(20))
+
+    def testPrefetch_reraisesProducerErrors(self):
+        def produce():
+            yield 1
+            yield 2
+            raise ValueError('broken frame')
+
+        items = prefetch(produce(), 4)
+        self.assertEqual(next(items), 1)
+        self.assertEqual(next(items), 2)
+        self.assertRaises(ValueError, next, items)
+
+    def testPrefetch_closeStopsAndJoinsProducer(self):
+        stopped = threading.Event()
+
+        def produce():
+            try:
+                while True:
+                    yield 0
+            finally:
+                stopped.set()
+
+        threads = threading.active_count()
+        items = prefetch(produce(), 2)
+        for _ in range(3):
+            next(items)
+        items.close()
+
+        # close only returns once the producer is stopped and its thread is gone
+        self.assertTrue(stopped.is_set())
+        self.assertEqual(threading.active_count(), threads)
+
+    def testPrefetch_buffersAtMostSizeItems(self):
+        size = 3
+        counts = {'produced': 0, 'consumed': 0}
+        lags = []
+
+        def produce():
+            for item in range(30):
+                counts['produced'] += 1
+                yield item
+
+        for _ in prefetch(produce(), size):
+            counts['consumed'] += 1
+            lags.append(counts['produced'] - counts['consumed'])
+            # A slow consumer, so that the producer always fills the buffer
+            time.sleep(0.005)
+
+        # On top of the buffered items, the producer holds the one waiting for room in the buffer
+        self.assertLessEqual(max(lags), size + 1)
+        self.assertGreaterEqual(max(lags), size)
@@ -0,0 +1,95 @@
+from unittest import TestCase
+import threading
+import time
+
+from app.jobs import JobQueue, QUEUED, RUNNING, DONE, FAILED, CANCELLED
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('Timed out')
+        time.sleep(0.005)
+
+
+class TestJobQueue(TestCase):
+    def setUp(self):
+        self.queue = JobQueue(concurrency=1, max_finished_jobs=2)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        # Never leave a worker blocked
+        self.release.set()
+
+    def block(self, job):
+        """A job which runs until released, or cancelled"""
+        while not self.release.wait(0.005):
+            job.check_cancelled()
+        return 'released'
+
+    def testSubmit_runsJobs(self):
+        job = self.queue.submit(lambda job, value: value * 2, 21)
+
+        wait_for(lambda: job.status == DONE)
+        self.assertEqual(job.result, 42)
+        self.assertIs(self.queue.get(job.id), job)
+
+    def testSubmit_runsOneJobAtATime(self):
+        running = self.queue.submit(self.block)
+        queued = self.queue.submit(lambda job: 'done')
+        wait_for(lambda: running.status == RUNNING)
+
+        time.sleep(0.05)
+        self.assertEqual(queued.status, QUEUED)
+
+        self.release.set()
+        wait_for(lambda: queued.status == DONE)
+        self.assertEqual(running.status, DONE)
+
+    def testCancel_queuedJob(self):
+        calls = []
+        running = self.queue.submit(self.block)
+        queued = self.queue.submit(lambda job: calls.append(job))
+        wait_for(lambda: running.status == RUNNING)
+
+        self.queue.cancel(queued.id)
+        self.assertEqual(queued.status, CANCELLED)
+
+        self.release.set()
+        wait_for(lambda: running.status == DONE)
+        # The worker takes the cancelled job off the queue without running it
+        wait_for(lambda: self.queue._pending.empty())
+        time.sleep(0.05)
+        self.assertEqual(queued.status, CANCELLED)
+        self.assertListEqual(calls, [])
+
+    def testCancel_runningJob(self):
+        job = self.queue.submit(self.block)
+        wait_for(lambda: job.status == RUNNING)
+
+        self.queue.cancel(job.id)
+
+        wait_for(lambda: job.status == CANCELLED)
+        self.assertIsNone(job.result)
+        self.assertIsNotNone(job.finished_at)
+
+    def testRun_failingJob(self):
+        def fail(job):
+            raise ValueError('No such image')
+
+        job = self.queue.submit(fail)
+
+        wait_for(lambda: job.status == FAILED)
+        self.assertEqual(job.error, 'No such image')
+        self.assertEqual(job.to_dict()['error'], 'No such image')
+
+    def testMaxFinishedJobs_forgetsOldestJobs(self):
+        jobs = [self.queue.submit(lambda job: None) for _ in range(3)]
+        wait_for(lambda: all(job.status == DONE for job in jobs))
+        # The worker forgets old jobs right after running one
+        wait_for(lambda: self.queue.get(jobs[0].id) is None)
+
+        self.assertIsNone(self.queue.get(jobs[0].id))
+        self.assertIs(self.queue.get(jobs[1].id), jobs[1])
+        self.assertIs(self.queue.get(jobs[2].id), jobs[2])
@@ -0,0 +1,60 @@
+from unittest import TestCase
+import numpy as np
+import cv2 as cv2
+
+from app.camera import Camera
+from app.surface import Surface
+from app.helper import perspective_transforms
+from app.planner import plan_path, repeated_poses
+
+
+SIZE = 100.0
+
+
+class TestPlanner(TestCase):
+    def setUp(self):
+        self.camera = Camera(50, width=200, height=200)
+        self.edge_2dpoints = np.array([(0, 0), (200, 0), (200, 200), (0, 200)])
+        # The front surface of a cube centered at the origin, facing -y
+        self.surface = Surface(None, np.array([(-SIZE/2, -SIZE/2, SIZE/2), (SIZE/2, -SIZE/2, SIZE/2),
+                                               (SIZE/2, -SIZE/2, -SIZE/2), (-SIZE/2, -SIZE/2, -SIZE/2)]),
+                               self.edge_2dpoints)
+
+    def testPerspectiveTransforms_matchesOpenCV(self):
+        sources = np.array([self.edge_2dpoints, self.edge_2dpoints], np.float64)
+        destinations = np.array([[(10, 20), (190, 5), (180, 170), (30, 199)],
+                                 [(0, 0), (100, 10), (100, 90), (0, 100)]], np.float64)
+
+        homographies = perspective_transforms(sources, destinations)
+
+        for source, destination, homography in zip(sources, destinations, homographies):
+            expected = cv2.getPerspectiveTransform(np.float32(source), np.float32(destination))
+            self.assertTrue(np.allclose(homography, expected, atol=1e-5))
+
+    def testPlanPath_visibility(self):
+        orientation = self.camera.orientation
+        positions = np.array([(0, -200, 0), (0, 200, 0)])
+        orientations = np.array([orientation, orientation])
+
+        plan = plan_path(self.camera, [self.surface], positions, orientations)
+
+        self.assertEqual(len(plan), 2)
+        self.assertTrue(plan.visible[0, 0])
+        self.assertFalse(plan.visible[1, 0])
+
+    def testPlanPath_homographyMatchesProjectSurface(self):
+        self.camera.position = np.array([10, -200, 5])
+
+        plan = plan_path(self.camera, [self.surface], [self.camera.position], [self.camera.orientation])
+
+        projected_points = self.camera.project_points(self.surface.edge_points3d) + (100, 100)
+        expected = cv2.getPerspectiveTransform(self.surface.edge_points2d, np.float32(projected_points))
+        self.assertTrue(np.allclose(plan.homographies[0, 0], expected, atol=1e-5))
+
+    def testRepeatedPoses_comparesAgainstLastRenderedPose(self):
+        orientations = np.array([self.camera.orientation] * 5)
+        positions = np.array([(0, 0, 0), (0, 0, 0), (0, 0.6, 0), (0, 1.2, 0), (0, 1.2, 0)])
+
+        repeats = repeated_poses(positions, orientations, tolerance=1)
+
+        self.assertTrue(np.array_equal(repeats, [False, True, True, False, True]))
@@ -0,0 +1,116 @@
+from unittest import TestCase
+import numpy as np
+
+import app.process as process
+from app.jobs import JobQueue
+from app.process import generate_bezier_path_and_orientations, smoothen_camera, resample_camera_path, \
+    samples_per_segment, submit_render, compositing_mode, path_timing, MAX_LINE_SEGMENTS, MAX_FRAMES
+
+
+FORWARD = np.array([[1.0, 0.0, 0.0],
+                    [0.0, 0.0, -1.0],
+                    [0.0, 1.0, 0.0]])
+
+
+class TestProcess(TestCase):
+    def setUp(self):
+        # A straight path along the y-axis made of 2 Bezier curves
+        self.points = [{'x': 0, 'y': y, 'z': 10} for y in range(7)]
+
+    def testBezierPath_shapes(self):
+        path_points, path_angles = generate_bezier_path_and_orientations(self.points, 3, 12)
+
+        self.assertEqual(path_points.shape, (24, 3))
+        self.assertEqual(path_angles.shape, (24,))
+
+    def testBezierPath_straightLine(self):
+        path_points, path_angles = generate_bezier_path_and_orientations(self.points, 3, 12)
+
+        self.assertTrue(np.allclose(path_points[:12, 1], np.arange(12) / 4.0))
+        self.assertTrue(np.allclose(path_points[:, 0], 0))
+        self.assertTrue(np.allclose(path_points[:, 2], 10))
+        self.assertTrue(np.all(path_angles == 90))
+
+    def testBezierPath_rejectsTooFewOrTooManySamples(self):
+        # Fewer than 3 samples leave no sample to interpolate the height over
+        self.assertRaises(ValueError, generate_bezier_path_and_orientations, self.points, 3, 2)
+        self.assertRaises(ValueError, generate_bezier_path_and_orientations, self.points, 3, MAX_LINE_SEGMENTS + 1)
+
+        path_points, _ = generate_bezier_path_and_orientations(self.points, 3, 3)
+        self.assertFalse(np.isnan(path_points).any())
+
+    def testSamplesPerSegment(self):
+        self.assertEqual(samples_per_segment({}), 256)
+        self.assertEqual(samples_per_segment({'samples_per_segment': '12'}), 12)
+        self.assertRaises(ValueError, samples_per_segment, {'samples_per_segment': 1})
+        self.assertRaises(ValueError, samples_per_segment, {'samples_per_segment': 10 ** 9})
+        self.assertRaises(ValueError, samples_per_segment, {'samples_per_segment': 'many'})
+
+    def testCompositingMode(self):
+        self.assertEqual(compositing_mode({}), 'or')
+        self.assertEqual(compositing_mode({'compositing': 'depth'}), 'depth')
+        self.assertRaises(ValueError, compositing_mode, {'compositing': 'detph'})
+
+    def testPathTiming(self):
+        self.assertEqual(path_timing({}), (None, 400))
+        self.assertEqual(path_timing({'duration': '2', 'camera_speed': 50}), (30, 50))
+        for data in ({'duration': 'abc'}, {'duration': -1}, {'duration': 0}, {'duration': 'nan'},
+                     {'duration': MAX_FRAMES}, {'camera_speed': 0}, {'camera_speed': -5}, {'camera_speed': 'inf'}):
+            self.assertRaises(ValueError, path_timing, data)
+
+    def testResampleCameraPath_tooManyFrames(self):
+        camera_path = np.array([(0, 0, 0), (0, 10, 0)])
+        camera_angles = np.array([90, 90])
+
+        self.assertRaises(ValueError, resample_camera_path, camera_path, camera_angles, camera_speed=1e-9)
+
+    def testSmoothenCamera_interpolatesOneFramePerDegree(self):
+        camera_path = np.array([(0, 0, 0), (0, 1, 0), (0, 2, 0)])
+        camera_angles = np.array([90, 92, 91])
+
+        positions, orientations = smoothen_camera(camera_path, camera_angles)
+
+        self.assertEqual(positions.shape, (3, 3))
+        self.assertEqual(orientations.shape, (3, 3, 3))
+        self.assertTrue(np.array_equal(positions, [(0, 1, 0), (0, 1, 0), (0, 2, 0)]))
+        self.assertTrue(np.allclose(orientations[0], FORWARD))
+
+    def testResampleCameraPath_steadySpeed(self):
+        camera_path = np.array([(0, 0, 0), (0, 1, 0), (0, 10, 0)])
+        camera_angles = np.array([90, 90, 90])
+
+        positions, orientations = resample_camera_path(camera_path, camera_angles, camera_speed=2, fps=2)
+
+        self.assertEqual(positions.shape, (10, 3))
+        self.assertTrue(np.allclose(positions[:, 1], np.linspace(0, 10, 10)))
+        self.assertTrue(np.allclose(orientations, FORWARD))
+
+    def testResampleCameraPath_frameBudget(self):
+        camera_path = np.array([(0, 0, 0), (0, 0, 0)])
+        camera_angles = np.array([350, 10])
+
+        positions, orientations = resample_camera_path(camera_path, camera_angles, 3)
+
+        # Turns through 0 degrees rather than the long way around
+        self.assertEqual(positions.shape, (3, 3))
+        self.assertTrue(np.allclose(orientations[1], [[0, -1, 0], [0, 0, -1], [1, 0, 0]]))
+
+    def testSubmitRender_sameVideoRenderedOnce(self):
+        render_jobs = process.render_jobs
+        # Without workers, the jobs stay queued
+        process.render_jobs = JobQueue(concurrency=0)
+        try:
+            data = {'scene': 'a' * 32, 'camera_path': self.points}
+            job = submit_render(dict(data, file_name='video'))
+
+            self.assertIs(submit_render(dict(data, file_name='reloaded')), job)
+            self.assertIsNot(submit_render(dict(data, file_name='video', samples_per_segment=12)), job)
+
+            job.cancel()
+            self.assertIsNot(submit_render(dict(data, file_name='video')), job)
+
+            # Each profiled render is a job of its own
+            profiled_job = submit_render(dict(data, file_name='video', profile=True))
+            self.assertIsNot(submit_render(dict(data, file_name='video', profile=True)), profiled_job)
+        finally:
+            process.render_jobs = render_jobs
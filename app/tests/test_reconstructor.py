@@ -1,4 +1,7 @@
 from unittest import TestCase
+
+import numpy as np
+
 from app.texture_extractor import Reconstructor
 
 
@@ -17,3 +20,23 @@ class TestReconstructor(TestCase):
         self.assertTupleEqual(reconstructor.calculate3DCoordinate((5, 10), 10), (0, 0, 10))
         self.assertTupleEqual(reconstructor.calculate3DCoordinate((0, 0), 10), (-2, 1, 10))
         self.assertTupleEqual(reconstructor.calculate3DCoordinate((7.5, 5), 10), (-1, -0.5, 10))
+
+    def test_calculate3DCoordinates(self):
+        reconstructor = Reconstructor((10, 20), 10, 5)
+        pixels = [(5, 10), (0, 0), (7.5, 5), (10, 20)]
+        depths = [10, 10, 10, 2.5]
+        coordinates = reconstructor.calculate3DCoordinates(pixels, depths)
+        self.assertEqual(coordinates.dtype, np.float32)
+        self.assertTrue(np.allclose(coordinates, [reconstructor.calculate3DCoordinate(pixel, depth)
+                                                  for pixel, depth in zip(pixels, depths)]))
+
+    def test_reconstructDepthMap(self):
+        reconstructor = Reconstructor((3, 4), 10, 5)
+        depthMap = np.arange(12).reshape((3, 4)) + 1
+        coordinates = reconstructor.reconstructDepthMap(depthMap)
+        self.assertTupleEqual(coordinates.shape, (3, 4, 3))
+        self.assertEqual(coordinates.dtype, np.float32)
+        for i in range(3):
+            for j in range(4):
+                self.assertTrue(np.allclose(coordinates[i, j],
+                                            reconstructor.calculate3DCoordinate((i, j), depthMap[i, j])))
@@ -0,0 +1,94 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from app.camera import Camera
+from app.cube import generate_path_and_orientation
+from app.jobs import JobCancelled
+from app.renderer import FrameRenderer
+from app.surface import Surface, Polyhedron, Space
+from app.textures import load_texture
+
+
+SIZE = 100.0
+
+# Available in most OpenCV builds
+ENCODING = {'encoder': 'opencv', 'fourcc': 'mp4v'}
+
+
+class TestFrameRenderer(TestCase):
+    def setUp(self):
+        self.camera = Camera(50, width=200, height=200)
+        edge_2dpoints = np.array([(0, 0), (200, 0), (200, 200), (0, 200)])
+        # The front and left surfaces of a cube centered at the origin
+        front = Surface(load_texture('../static/cube/front.png'),
+                        np.array([(-SIZE/2, -SIZE/2, SIZE/2), (SIZE/2, -SIZE/2, SIZE/2),
+                                  (SIZE/2, -SIZE/2, -SIZE/2), (-SIZE/2, -SIZE/2, -SIZE/2)]), edge_2dpoints)
+        left = Surface(load_texture('../static/cube/left.png'),
+                       np.array([(-SIZE/2, SIZE/2, SIZE/2), (-SIZE/2, -SIZE/2, SIZE/2),
+                                 (-SIZE/2, -SIZE/2, -SIZE/2), (-SIZE/2, SIZE/2, -SIZE/2)]), edge_2dpoints)
+        self.space = Space([Polyhedron([front, left])])
+        self.positions, self.orientations = generate_path_and_orientation()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def segments(self, num_of_frames, segment_length):
+        return [(index, start, min(start + segment_length, num_of_frames),
+                 os.path.join(self.directory, 'segment_%d.mp4' % index))
+                for index, start in enumerate(range(0, num_of_frames, segment_length))]
+
+    def testRenderPlan_parallelMatchesSerial(self):
+        serial = FrameRenderer(self.camera, self.space, workers=1)
+        parallel = FrameRenderer(self.camera, self.space, workers=3, chunk_size=4)
+        plan = serial.plan(self.positions, self.orientations)
+
+        serial_frames = [frame.copy() for frame in serial.render_plan(plan)]
+        parallel_frames = list(parallel.render_plan(plan))
+
+        self.assertEqual(len(parallel_frames), len(self.positions))
+        self.assertEqual(len(serial_frames), len(parallel_frames))
+        # The frames must differ along the path for their order to be checked
+        self.assertFalse(np.array_equal(serial_frames[0], serial_frames[len(serial_frames) / 2]))
+        for serial_frame, parallel_frame in zip(serial_frames, parallel_frames):
+            self.assertTrue(np.array_equal(serial_frame, parallel_frame))
+
+    def testRenderSegments_reportsEveryFrame(self):
+        renderer = FrameRenderer(self.camera, self.space, workers=1)
+        plan = renderer.plan(self.positions[:10], self.orientations[:10])
+        reports = []
+
+        list(renderer.render_segments(plan, self.segments(10, 4), queue_size=0, encoding=ENCODING,
+                                      progress=reports.append))
+
+        self.assertListEqual(reports, range(1, 11))
+
+    def testRenderSegments_progressErrorStopsRendering(self):
+        renderer = FrameRenderer(self.camera, self.space, workers=1)
+        plan = renderer.plan(self.positions[:10], self.orientations[:10])
+
+        def cancel_at_third_frame(frames_rendered):
+            if frames_rendered == 3:
+                raise JobCancelled()
+
+        # Frames are rendered on a background thread, ahead of the encoder
+        segments = renderer.render_segments(plan, self.segments(10, 5), encoding=ENCODING,
+                                            progress=cancel_at_third_frame)
+        self.assertRaises(JobCancelled, list, segments)
+        # The first segment was never completed
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'segment_0.mp4')))
+
+    def testRenderSegments_reportsWorkersProgress(self):
+        renderer = FrameRenderer(self.camera, self.space, workers=2)
+        plan = renderer.plan(self.positions[:12], self.orientations[:12])
+        reports = []
+
+        segments = list(renderer.render_segments(plan, self.segments(12, 4), encoding=ENCODING,
+                                                 progress=reports.append))
+
+        self.assertEqual(len(segments), 3)
+        self.assertListEqual(reports, sorted(reports))
+        self.assertEqual(reports[-1], 12)
@@ -0,0 +1,48 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from app.segments import SegmentManifest, encode_segment
+
+
+class TestSegments(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testManifest_segmentsCoverAllFrames(self):
+        manifest = SegmentManifest(self.directory, 25, segment_length=10)
+
+        ranges = [(start, end) for _, start, end, _ in manifest.segments()]
+
+        self.assertEqual(ranges, [(0, 10), (10, 20), (20, 25)])
+
+    def testManifest_resumesFromEncodedSegments(self):
+        manifest = SegmentManifest(self.directory, 25, segment_length=10)
+        for index in (0, 1):
+            open(manifest.segment_path(index), 'w').close()
+            manifest.complete(index)
+        # The second segment's file was lost
+        os.remove(manifest.segment_path(1))
+
+        resumed_manifest = SegmentManifest(self.directory, 25, segment_length=10)
+
+        self.assertEqual([index for index, _, _, _ in resumed_manifest.pending()], [1, 2])
+        self.assertEqual(resumed_manifest.completed_frames(), 10)
+        # A different video doesn't reuse the segments
+        self.assertEqual(len(SegmentManifest(self.directory, 30, segment_length=10).pending()), 3)
+
+    def testEncodeSegment_removesPartialFileOnFailure(self):
+        def frames():
+            yield np.zeros((16, 16, 3), np.uint8)
+            raise RuntimeError('Render failed')
+        file_path = os.path.join(self.directory, 'segment_0.mp4')
+
+        self.assertRaises(RuntimeError, encode_segment, 16, 16, frames(), file_path,
+                          encoding={'encoder': 'opencv', 'fourcc': 'mp4v'})
+
+        self.assertEqual(os.listdir(self.directory), [])
@@ -1,7 +1,11 @@
 from unittest import TestCase
+import shutil
+import tempfile
+import threading
 import numpy as np
 
-from app.surface import Surface
+from app.surface import Surface, Polyhedron, Space
+from app.textures import TextureStore
 
 
 # The test surface is parallel to the x-y plane (a horizontal plane)
@@ -35,3 +39,47 @@ class TestSurface(TestCase):
         dist = self.surface.distance_to_point(point)
 
         self.assertAlmostEqual(dist, -6)
+
+    def testMipmap_halvesTheTexture(self):
+        surface = Surface(np.zeros((5, 8, 3), np.uint8), self.surface.edge_points3d, self.surface.edge_points2d)
+
+        image, level = surface.mipmap(1)
+        self.assertEqual((image.shape, level), ((3, 4, 3), 1))
+
+        # The texture can't be halved any further than 1 pixel
+        image, level = surface.mipmap(10)
+        self.assertEqual((image.shape, level), ((1, 1, 3), 3))
+
+    def testMipmap_sharedByThreads(self):
+        surface = Surface(np.zeros((64, 64, 3), np.uint8), self.surface.edge_points3d, self.surface.edge_points2d)
+        results = []
+
+        def build():
+            results.append([surface.mipmap(level)[0].shape for level in (3, 1, 5)])
+        threads = [threading.Thread(target=build) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [[(8, 8, 3), (32, 32, 3), (2, 2, 3)]] * 4)
+        self.assertEqual([image.shape[0] for image in surface._mipmaps], [64, 32, 16, 8, 4, 2])
+
+    def testSpaceSaveLoad(self):
+        path = tempfile.mkdtemp()
+        try:
+            store = TextureStore(path)
+            image = np.arange(2 * 3 * 3, dtype=np.uint8).reshape(2, 3, 3)
+            surface = Surface(image, self.surface.edge_points3d, np.array([(0, 0), (3, 0), (3, 2), (0, 2)]))
+            Space([Polyhedron([surface]), Polyhedron([surface, surface])]).save(path + '/space.npy', store)
+
+            space = Space.load(path + '/space.npy', store)
+
+            self.assertEqual([len(model.surfaces) for model in space.models], [1, 2])
+            loaded_surface = space.models[1].surfaces[0]
+            self.assertTrue(np.array_equal(loaded_surface.image, image))
+            self.assertTrue(np.array_equal(loaded_surface.edge_points3d, surface.edge_points3d))
+            self.assertTrue(np.array_equal(loaded_surface.edge_points2d, surface.edge_points2d))
+            self.assertTrue(np.array_equal(loaded_surface.normal, surface.normal))
+        finally:
+            shutil.rmtree(path)
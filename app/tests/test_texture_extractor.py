@@ -0,0 +1,25 @@
+from unittest import TestCase
+
+import numpy as np
+
+from app.texture_extractor import TextureExtractor
+
+
+class TestTextureExtractor(TestCase):
+
+    def setUp(self):
+        self.image = np.arange(40 * 60 * 3, dtype=np.uint8).reshape((40, 60, 3))
+        self.extractor = TextureExtractor(self.image)
+
+    def test_extractTexture_size(self):
+        # Corners in any order, with sizes that aren't whole pixels
+        texture = self.extractor.extractTexture([(50.5, 30.2), (10, 5), (50.5, 5), (10, 30.2)])
+        self.assertTupleEqual(texture.shape, (25, 40, 3))
+
+    def test_extractTextures_matches_extractTexture(self):
+        quads = [[(0, 0), (30, 0), (30, 20), (0, 20)],
+                 [(20, 10), (55, 5), (58, 38), (25, 30)]]
+        textures = self.extractor.extractTextures(quads)
+        self.assertEqual(len(textures), 2)
+        for quad, texture in zip(quads, textures):
+            self.assertTrue(np.array_equal(texture, self.extractor.extractTexture(quad)))
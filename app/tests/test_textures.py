@@ -0,0 +1,73 @@
+from unittest import TestCase
+import os
+import pickle
+import shutil
+import tempfile
+import numpy as np
+import cv2 as cv2
+
+from app.surface import Surface
+from app.textures import TextureStore, load_texture
+
+
+class TestTextures(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = TextureStore(self.path)
+        self.image = np.arange(4 * 5 * 3, dtype=np.uint8).reshape(4, 5, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def testShare_sameContentSameTexture(self):
+        key, texture = self.store.share(self.image)
+        other_key, other_texture = self.store.share(self.image.copy())
+
+        self.assertEqual(key, other_key)
+        self.assertIs(texture, other_texture)
+        self.assertTrue(np.array_equal(texture, self.image))
+        self.assertFalse(texture.flags.writeable)
+
+    def testPut_evictsLeastRecentlyUsedTextures(self):
+        # Room for 2 of the textures, of 60 bytes and a header each
+        store = TextureStore(self.path, max_size=2 * (60 + 128))
+        images = [np.full((4, 5, 3), value, np.uint8) for value in range(4)]
+        keys = [store.put(image) for image in images[:2]]
+        os.utime(store._file_path(keys[0]), (1000, 1000))
+        os.utime(store._file_path(keys[1]), (2000, 2000))
+        store.pin([keys[0]])
+
+        keys.append(store.put(images[2]))
+        # The oldest texture is pinned, the next oldest goes
+        self.assertTrue(os.path.exists(store._file_path(keys[0])))
+        self.assertFalse(os.path.exists(store._file_path(keys[1])))
+        self.assertTrue(os.path.exists(store._file_path(keys[2])))
+
+        # Textures still used by this process are kept too
+        texture = store.get(keys[2])
+        keys.append(store.put(images[3]))
+        self.assertTrue(os.path.exists(store._file_path(keys[2])))
+        self.assertTrue(np.array_equal(texture, images[2]))
+
+    def testSurface_pickledWithTextureHandle(self):
+        surface = Surface(self.image, np.array([(0, 1, 1), (1, 1, 1), (1, 0, 1), (0, 0, 1)]),
+                          np.array([(0, 0), (5, 0), (5, 4), (0, 4)]))
+        surface.share_texture(self.store)
+
+        data = pickle.dumps(surface, 2)
+        unpickled_surface = pickle.loads(data)
+
+        self.assertNotIn(self.image.tostring(), data)
+        self.assertTrue(np.array_equal(unpickled_surface.image, self.image))
+
+    def testLoadTexture_decodedOnceUntilModified(self):
+        image_path = self.path + '/image.png'
+        cv2.imwrite(image_path, self.image)
+
+        image = load_texture(image_path)
+        self.assertIs(load_texture(image_path), image)
+        self.assertTrue(np.array_equal(image, self.image))
+
+        os.utime(image_path, (0, 0))
+        self.assertIsNot(load_texture(image_path), image)
+        self.assertIsNone(load_texture(self.path + '/missing.png'))
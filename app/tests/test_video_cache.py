@@ -0,0 +1,38 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+
+from app.video_cache import VideoCache
+
+
+class TestVideoCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = VideoCache(self.directory, '/static/video', max_size=25)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writeVideo(self, key, size, last_used):
+        with open(self.cache.file_path(key), 'wb') as video_file:
+            video_file.write('x' * size)
+        os.utime(self.cache.file_path(key), (last_used, last_used))
+
+    def testGet(self):
+        self.writeVideo('a' * 40, 10, 1000)
+
+        self.assertEqual(self.cache.get('a' * 40), '/static/video/%s.mp4' % ('a' * 40))
+        self.assertIsNone(self.cache.get('b' * 40))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def testPut_evictsLeastRecentlyUsedVideos(self):
+        self.writeVideo('a' * 40, 10, 1000)
+        self.writeVideo('b' * 40, 10, 2000)
+        self.writeVideo('c' * 40, 10, 3000)
+        self.cache.get('a' * 40)
+        open(os.path.join(self.directory, 'cube.mp4'), 'w').close()
+
+        self.cache.put('c' * 40)
+
+        self.assertEqual(sorted(os.listdir(self.directory)), ['a' * 40 + '.mp4', 'c' * 40 + '.mp4', 'cube.mp4'])
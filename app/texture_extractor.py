@@ -1,9 +1,18 @@
+import os
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
 import cv2
 import numpy as np
 import math
 
 from app.reconstructor import Reconstructor
-from app.graham_scan import *
+from app.helper import perspective_transforms
+
+
+# Number of threads warping the textures of a batch of quads at the same time.
+# OpenCV releases the GIL while warping, so the warps run in parallel.
+WARP_THREADS = int(os.environ.get('TEXTURE_EXTRACTOR_THREADS', cpu_count()))
 
 
 class TextureExtractor(object):
@@ -28,87 +37,86 @@ class TextureExtractor(object):
         @param:
             corners: an array of 4 points, each is a tuple (x,y,d) where (x,y) is
             position of the corner on the image, d is the distance from the camera
-            to the real-world corner
+            to the real-world corner. d is only needed with a reconstructor
         @return:
             the texture extracted.
         """
+        return self.extractTextures([corners])[0]
 
-        # Make sure the there are 4 points in the CCW order
-        # Assertion comes after Graham Scan because the scan can remove some points
-        corners = calculateConvexHull(corners)
-        assert (len(corners) == 4)
+    def extractTextures(self, quads):
+        """
+        Extract the textures enclosed by several quads on the image at once
+        @param:
+            quads: a list of quads, each as the corners of extractTexture
+        @return:
+            the list of textures extracted, in the order of the quads.
+        """
+        quads = np.array(quads, np.float64)
+        assert quads.ndim == 3 and quads.shape[1] == 4
 
         # Sort corners to the clock wise order, starting with top-left
-        corners = self.__sortCorners (corners)
+        quads = self.sortCorners(quads)
+        corners = quads[:, :, :2]
+
+        # Make sure that the quads are convex
+        edges = np.roll(corners, -1, axis=1) - corners
+        turns = edges[:, :, 0] * np.roll(edges, -1, axis=1)[:, :, 1] - \
+            edges[:, :, 1] * np.roll(edges, -1, axis=1)[:, :, 0]
+        assert (turns > 0).all()
 
         # Reconstruct the 3D position of the corners to calculate the optimal width and height
-        cornerPositions = [(0, 0, 0)] * 4
         if self.reconstructor is not None:
-            for i in range(4):
-                cornerPositions[i] = self.reconstructor.calculate3DCoordinate (corners[i], corners[i][2])
-                corners[i] = [corners[i][0], corners[i][1]]
+            cornerPositions = self.reconstructor.calculate3DCoordinates(
+                quads[:, :, :2].reshape(-1, 2), quads[:, :, 2].ravel(), np.float64).reshape(quads.shape[:2] + (3,))
         else:
-            for i in range(4):
-                corners[i] = [corners[i][0], corners[i][1]]
-                cornerPositions[i] = [corners[i][0], corners[i][1], 0]
+            cornerPositions = np.dstack([corners, np.zeros(corners.shape[:2])])
 
-        width = max(self.distanceBetweenPoints(cornerPositions[0], cornerPositions[1]),
-                    self.distanceBetweenPoints(cornerPositions[2], cornerPositions[3]))
-        height = max(self.distanceBetweenPoints(cornerPositions[0], cornerPositions[3]),
-                     self.distanceBetweenPoints(cornerPositions[1], cornerPositions[2]))
+        sideLengths = np.sqrt(np.sum((np.roll(cornerPositions, -1, axis=1) - cornerPositions) ** 2, axis=2))
+        widths = np.maximum(sideLengths[:, 0], sideLengths[:, 2])
+        heights = np.maximum(sideLengths[:, 3], sideLengths[:, 1])
 
         if self.reconstructor is not None:
-            print width, height
-            width /= self.reconstructor.resolution
-            height /= self.reconstructor.resolution
-            print width, height
+            widths /= self.reconstructor.resolution
+            heights /= self.reconstructor.resolution
+
+        # Apply the transformation of every quad to its texture
+        zeros = np.zeros_like(widths)
+        textureCorners = np.dstack([np.column_stack([zeros, widths, widths, zeros]),
+                                    np.column_stack([zeros, zeros, heights, heights])])
+        transformMatrices = perspective_transforms(np.float32(corners), np.float32(textureCorners))
+        sizes = [(int(width), int(height)) for width, height in zip(widths, heights)]
+
+        if len(quads) == 1 or WARP_THREADS <= 1:
+            return [cv2.warpPerspective(self.image, matrix, size) for matrix, size in zip(transformMatrices, sizes)]
 
-        # Create the texture and apply transformation to the quad
-        texture = np.empty((width, height))
-        textureCorners = np.array([(0, 0), (width, 0), (width, height), (0, height)], np.float32)
-        corners = np.array(corners, np.float32)
-        transformMatrix = cv2.getPerspectiveTransform(corners, textureCorners)
-        texture = cv2.warpPerspective(self.image, transformMatrix, texture.shape)
+        def warp(index):
+            return cv2.warpPerspective(self.image, transformMatrices[index], sizes[index])
 
-        return texture
+        pool = ThreadPool(min(WARP_THREADS, len(quads)))
+        try:
+            return pool.map(warp, range(len(quads)))
+        finally:
+            pool.close()
 
-    def __sortCorners(self, corners):
+    def sortCorners(self, quads):
         """
-        Sort the corners, return them in the order:
+        Sort the corners of each quad in the order:
         top-left, top-right, bottom-right, bottom-left
+        @param:
+            quads: an array of shape (Q, 4, 2) or (Q, 4, 3) of the corners (x, y, [d])
+        @return:
+            the quads with their corners sorted
         """
-
-        # Calculate the center point by averaging the corners
-        center = [0, 0]
-        for corner in corners:
-            center[0] += corner[0]
-            center[1] += corner[1]
-        center[0] /= len(corners)
-        center[1] /= len(corners)
-
-        # Define the corners position by comparing with the center
-        # Corners having lower y => top corners
-        # Corners having lower x => left corners
-        bottom = []
-        top = []
-        for corner in corners:
-            if corner[1] < center[1]:
-                top.append(corner)
-            else:
-                bottom.append(corner)
-        topLeft = top[0]
-        topRight = top[1]
-        if top[0][0] > top[1][0]:
-           topLeft = top[1]
-           topRight = top[0]
-        bottomLeft = bottom[0]
-        bottomRight = bottom[1]
-        if bottom[0][0] > bottom[1][0]:
-           bottomLeft = bottom[1]
-           bottomRight = bottom[0]
-
-        # Return the result
-        return [topLeft, topRight, bottomRight, bottomLeft]
+        # The 2 corners higher than the center are the top corners.
+        # Of each pair, the corner with the lower x is the left one
+        quadIndices = np.arange(len(quads))[:, np.newaxis]
+        center = quads[:, :, 1].mean(axis=1)
+        assert ((quads[:, :, 1] < center[:, np.newaxis]).sum(axis=1) == 2).all()
+        byHeight = quads[quadIndices, np.argsort(quads[:, :, 1], axis=1, kind='mergesort')]
+        top, bottom = byHeight[:, :2], byHeight[:, 2:]
+        top = top[quadIndices, np.argsort(top[:, :, 0], axis=1, kind='mergesort')]
+        bottom = bottom[quadIndices, np.argsort(-bottom[:, :, 0], axis=1, kind='mergesort')]
+        return np.concatenate([top, bottom], axis=1)
 
     def distanceBetweenPoints(self, p1, p2):
         n = min(len(p1), len(p2))
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import tempfile
+import threading
+import weakref
+
+import cv2 as cv2
+import numpy as np
+
+from cache import LRUCache
+from metrics import increment
+
+
+# Bytes of decoded images kept in memory by load_texture
+TEXTURE_CACHE_SIZE = int(os.environ.get('TEXTURE_CACHE_SIZE', 128 * 1024 * 1024))
+
+# Where the shared textures are written. They are named after their content,
+# so the files can be shared by every process and every render on the host.
+TEXTURE_STORE_PATH = os.environ.get('TEXTURE_STORE_PATH', os.path.join(tempfile.gettempdir(), 'textures'))
+
+# Maximum number of bytes of textures kept in a store, see TextureStore.evict
+TEXTURE_STORE_SIZE = int(os.environ.get('TEXTURE_STORE_SIZE', 1024 * 1024 * 1024))
+
+PINNED_DIRECTORY = 'pinned'
+
+
+class TextureStore(object):
+    """
+    Textures written once to .npy files and memory-mapped read-only, so that all
+    the processes rendering a scene share a single physical copy of its textures.
+
+    Every new texture, e.g. of each new slicing of an image, adds a file. When
+    the files take more than max_size bytes, the least recently used ones are
+    deleted, except the textures pinned by saved scenes and the ones this
+    process still uses. The store can also be cleaned up by hand while the
+    server is stopped by deleting the whole directory, pinned textures included
+    if the saved scenes go with it.
+    """
+
+    def __init__(self, path=TEXTURE_STORE_PATH, max_size=TEXTURE_STORE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        # key -> texture mapped by this process, for as long as something uses it
+        self._textures = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def put(self, image):
+        """
+        :return: the key of the texture, which is derived from its content
+        """
+        image = np.ascontiguousarray(image)
+        digest = hashlib.sha1('%s:%s:' % (image.dtype.str, image.shape))
+        digest.update(image.data)
+        key = digest.hexdigest()
+
+        file_path = self._file_path(key)
+        if os.path.exists(file_path):
+            self._touch(key)
+        else:
+            if not os.path.isdir(self.path):
+                try:
+                    os.makedirs(self.path)
+                except OSError:
+                    # Created by another process in the meantime
+                    pass
+            # Write to a temporary file first so that readers never see a partial texture
+            temp_path = '%s.%d.%d.tmp' % (file_path, os.getpid(), threading.current_thread().ident)
+            with open(temp_path, 'wb') as temp_file:
+                np.save(temp_file, image)
+            os.rename(temp_path, file_path)
+            self.evict(keep=key)
+        return key
+
+    def get(self, key):
+        """
+        :return: the texture as a read-only memory-mapped array
+        """
+        with self._lock:
+            texture = self._textures.get(key)
+            if texture is None:
+                texture = np.load(self._file_path(key), mmap_mode='r')
+                self._textures[key] = texture
+                self._touch(key)
+            return texture
+
+    def share(self, image):
+        """
+        :return: (key, texture) the key of the image and its memory-mapped copy
+        """
+        key = self.put(image)
+        return key, self.get(key)
+
+    def pin(self, keys):
+        """
+        Keep textures in the store for good, e.g. the ones of a saved scene
+        """
+        pinned_path = os.path.join(self.path, PINNED_DIRECTORY)
+        if not os.path.isdir(pinned_path):
+            try:
+                os.makedirs(pinned_path)
+            except OSError:
+                # Created by another process in the meantime
+                pass
+        for key in keys:
+            open(os.path.join(pinned_path, key), 'a').close()
+
+    def evict(self, keep=None):
+        """
+        Delete the least recently used textures until the store takes at most
+        max_size bytes. Pinned textures, the ones mapped by this process and keep
+        are never deleted. Other processes keep the textures they already mapped,
+        but can't map them anymore.
+        """
+        pinned_path = os.path.join(self.path, PINNED_DIRECTORY)
+        pinned = set(os.listdir(pinned_path)) if os.path.isdir(pinned_path) else set()
+        with self._lock:
+            in_use = set(self._textures.keys())
+
+        textures = []
+        for file_name in os.listdir(self.path):
+            if not file_name.endswith('.npy'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, file_name))
+            except OSError:
+                # Deleted by another process in the meantime
+                continue
+            textures.append((stat.st_mtime, stat.st_size, file_name[:-len('.npy')]))
+
+        size = sum(texture_size for _, texture_size, _ in textures)
+        for _, texture_size, key in sorted(textures):
+            if size <= self.max_size:
+                break
+            if key == keep or key in pinned or key in in_use:
+                continue
+            try:
+                os.remove(self._file_path(key))
+            except OSError:
+                continue
+            size -= texture_size
+            increment('textures.evictions')
+
+    def _touch(self, key):
+        # The modification time of a texture is its last use
+        try:
+            os.utime(self._file_path(key), None)
+        except OSError:
+            pass
+
+    def _file_path(self, key):
+        return os.path.join(self.path, '%s.npy' % key)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def texture_store(path=TEXTURE_STORE_PATH):
+    """
+    :return: the TextureStore of the given directory, one per process
+    """
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = TextureStore(path)
+        return _stores[path]
+
+
+decoded_textures_cache = LRUCache(TEXTURE_CACHE_SIZE, size_of=lambda image: image.nbytes)
+
+
+def load_texture(image_path):
+    """
+    Decode a color image, or reuse it if it was decoded since the file last changed.
+
+    :return: the image as a read-only array, shared with the other callers,
+    or None if the image can't be read, like cv2.imread
+    """
+    try:
+        stat = os.stat(image_path)
+    except OSError:
+        return None
+    key = (os.path.abspath(image_path), stat.st_mtime, stat.st_size)
+    image = decoded_textures_cache.get(key)
+    if image is None:
+        image = cv2.imread(image_path, cv2.CV_LOAD_IMAGE_COLOR)
+        if image is None:
+            return None
+        image.flags.writeable = False
+        decoded_textures_cache.put(key, image)
+    return image
+
+
+def warm_up_textures(image_paths):
+    """
+    Decode images ahead of time, e.g. at start, so that requests find them in the cache
+    """
+    for image_path in image_paths:
+        load_texture(image_path)
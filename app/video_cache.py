@@ -0,0 +1,83 @@
+import os
+import re
+import threading
+
+from metrics import increment
+
+
+# Maximum number of bytes of rendered videos kept around
+VIDEO_CACHE_SIZE = int(os.environ.get('VIDEO_CACHE_SIZE', 1024 * 1024 * 1024))
+
+CACHED_VIDEO_PATTERN = re.compile(r'^[0-9a-f]{40}\.mp4$')
+
+
+class VideoCache(object):
+    """
+    Rendered videos named after the key of the request that rendered them, so
+    that the same request is answered with the existing video. When the videos
+    take more than max_size bytes, the least recently used ones are deleted.
+
+    The files are the cache: their modification time is their last use, so the
+    cache survives restarts. Other files of the directory are left alone.
+    """
+
+    def __init__(self, directory, url_path, max_size=VIDEO_CACHE_SIZE):
+        """
+        :param directory: directory of the videos
+        :param url_path: url of the directory
+        """
+        self.directory = directory
+        self.url_path = url_path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :return: the url of the video of the key, or None if it isn't cached
+        """
+        file_path = self.file_path(key)
+        try:
+            # Mark the video as recently used
+            os.utime(file_path, None)
+        except OSError:
+            self.misses += 1
+            increment('video_cache.misses')
+            return None
+        self.hits += 1
+        increment('video_cache.hits')
+        return self.url(key)
+
+    def put(self, key):
+        """
+        Add the video just written to file_path(key), evicting older videos if needed.
+
+        :return: the url of the video
+        """
+        with self._lock:
+            videos = []
+            for file_name in os.listdir(self.directory):
+                if CACHED_VIDEO_PATTERN.match(file_name):
+                    stat = os.stat(os.path.join(self.directory, file_name))
+                    videos.append((stat.st_mtime, stat.st_size, file_name))
+
+            size = sum(video_size for _, video_size, _ in videos)
+            for _, video_size, file_name in sorted(videos):
+                if size <= self.max_size:
+                    break
+                if file_name == os.path.basename(self.file_path(key)):
+                    continue
+                os.remove(os.path.join(self.directory, file_name))
+                size -= video_size
+                increment('video_cache.evictions')
+        return self.url(key)
+
+    def __contains__(self, key):
+        return os.path.exists(self.file_path(key))
+
+    def file_path(self, key):
+        return os.path.join(self.directory, '%s.mp4' % key)
+
+    def url(self, key):
+        return '%s/%s.mp4' % (self.url_path, key)
@@ -0,0 +1,264 @@
+"""
+Benchmark the video rendering pipeline on reproducible scenes.
+
+The scenes are the 3 cubes of the /cube page and the 5-wall rooms that
+/generate_video slices out of cmu.jpg and stanford.jpg, with the default
+plane rectangle and vanishing point of the Plan View and a fixed camera path.
+Every stage of the pipeline is timed separately and the results are written as
+JSON so that runs on different commits can be compared. The convex hull used
+to extract the textures is also timed against its former pure Python version.
+
+Run it from the repository root:
+
+    python benchmark.py --frames 300 --workers 4 --output results.json
+"""
+import argparse
+import json
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from app.camera import Camera, RenderTarget, generate_video
+from app.graham_scan import calculateConvexHull, isCW
+from app.cube import CUBE_SIZE, build_cube, generate_path_and_orientation
+from app.cut_image import cut_image, sliced_surfaces_cache
+from app.planner import render_planned_frame
+from app.process import generate_bezier_path_and_orientations, smoothen_camera
+from app.renderer import FrameRenderer
+from app.surface import Polyhedron, Space
+
+
+# Defaults of the Plan View in main.js, in canvas coordinates
+CANVAS_WIDTH = 828
+PLANE_RECT = (198, 225, 378, 226)  # x, y, width, height
+VANISHING_POINT = (335, 415.5)
+WORLD = (741, 304, 2095)  # width, height, depth
+CAMERA_HEIGHT = 40
+
+# Control points of 2 Bezier curves walking into the room
+ROOM_CAMERA_PATH = [(0, -2000), (-250, -1700), (250, -1300), (0, -1000), (-200, -700), (200, -500), (0, -300)]
+
+ROOM_IMAGES = {'cmu': ('cmu.jpg', 1632), 'stanford': ('stanford.jpg', 1053)}
+
+# Number of rendered frames kept around to benchmark the encoder
+ENCODED_FRAMES_SAMPLE = 32
+
+# Number of times the convex hulls are computed for their timings
+CONVEX_HULL_REPEATS = 5
+
+
+@contextmanager
+def timed(stages, name):
+    start_time = time.time()
+    yield
+    stages[name] = stages.get(name, 0.0) + time.time() - start_time
+
+
+def build_cube_scene(stages):
+    with timed(stages, 'slicing'):
+        space = Space()
+        space.add_model(build_cube(CUBE_SIZE, offset_x=-CUBE_SIZE/2, offset_y=-CUBE_SIZE/2, offset_z=-CUBE_SIZE/2))
+        space.add_model(build_cube(CUBE_SIZE/2, offset_x=CUBE_SIZE, offset_y=0, offset_z=0))
+        space.add_model(build_cube(CUBE_SIZE/4, offset_x=-CUBE_SIZE, offset_y=-CUBE_SIZE, offset_z=-CUBE_SIZE/2))
+
+    with timed(stages, 'path'):
+        positions, orientations = generate_path_and_orientation()
+
+    return space, Camera(500.0, width=640, height=480), np.array(positions), np.array(orientations)
+
+
+def build_room_scene(stages, image_name, image_width):
+    scale = float(CANVAS_WIDTH) / image_width
+    x, y, width, height = [int(value / scale) for value in PLANE_RECT]
+    inner_box = ((x, y), (x + width, y + height))
+    vanishing_point = tuple(int(value / scale) for value in VANISHING_POINT)
+
+    # Measure the slicing itself, not the cache
+    sliced_surfaces_cache.clear()
+    with timed(stages, 'slicing'):
+        space = Space()
+        space.add_model(Polyhedron(cut_image(image_name, WORLD, inner_box, vanishing_point)))
+
+    with timed(stages, 'path'):
+        points = [{'x': x, 'y': y, 'z': CAMERA_HEIGHT} for x, y in ROOM_CAMERA_PATH]
+        camera_path, camera_angles = generate_bezier_path_and_orientations(points, 3)
+        heading = camera_angles.astype(int) != 0
+        positions, orientations = smoothen_camera(camera_path[heading], camera_angles[heading])
+
+    return space, Camera(WORLD[2] / 2, width=970, height=400), positions, orientations
+
+
+def benchmark_scene(name, build_scene, num_of_frames, workers):
+    stages = {}
+    space, camera, positions, orientations = build_scene(stages)
+
+    # Loop over the path until there are enough frames
+    frames_indices = np.arange(num_of_frames) % len(positions)
+    positions, orientations = positions[frames_indices], orientations[frames_indices]
+
+    renderer = FrameRenderer(camera, space, workers=1)
+    with timed(stages, 'projection'):
+        plan = renderer.plan(positions, orientations)
+
+    target = RenderTarget(camera.width, camera.height)
+    latencies = []
+    sample_frames = []
+    for index in xrange(len(plan)):
+        start_time = time.time()
+        frame = render_planned_frame(camera, renderer.surfaces, plan, index, target)
+        latencies.append(time.time() - start_time)
+        if len(sample_frames) < ENCODED_FRAMES_SAMPLE:
+            sample_frames.append(frame.copy())
+    stages['compositing'] = sum(latencies)
+
+    video_path = tempfile.mkdtemp()
+    try:
+        with timed(stages, 'encoding'):
+            generate_video(camera.width, camera.height,
+                           (sample_frames[i % len(sample_frames)] for i in xrange(num_of_frames)),
+                           name, path=video_path)
+    finally:
+        shutil.rmtree(video_path)
+
+    result = {
+        'frames': num_of_frames,
+        'surfaces': len(renderer.surfaces),
+        'stages': stages,
+        'fps': num_of_frames / stages['compositing'],
+        'frame_latency_ms': {
+            'mean': 1000 * np.mean(latencies),
+            'p50': 1000 * np.percentile(latencies, 50),
+            'p99': 1000 * np.percentile(latencies, 99),
+        },
+    }
+
+    if workers > 1:
+        parallel_renderer = FrameRenderer(camera, space, workers=workers)
+        start_time = time.time()
+        for _ in parallel_renderer.render_plan(plan):
+            pass
+        result['parallel_fps'] = num_of_frames / (time.time() - start_time)
+
+    # ru_maxrss is in kilobytes on Linux and only ever grows, so it is the peak
+    # of the whole run so far, including the previous scenes
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return result
+
+
+def legacy_convex_hull(points):
+    """The pure Python Graham scan that calculateConvexHull replaced, as a reference"""
+    def keep_left(hull, r):
+        while len(hull) > 1 and isCW(hull[-2], hull[-1], r) != 1:
+            hull.pop()
+        if not len(hull) or hull[-1] != r:
+            hull.append(r)
+        return hull
+
+    points = sorted(points)
+    l = reduce(keep_left, points, [])
+    u = reduce(keep_left, reversed(points), [])
+    return l.extend(u[i] for i in xrange(1, len(u) - 1)) or l
+
+
+def benchmark_convex_hull(num_of_points):
+    """
+    Time the convex hull of random candidate points, of points all on the
+    hull, and of points only found off the hull late, against the legacy implementation.
+    """
+    random = np.random.RandomState(0)
+    angles = random.rand(num_of_points) * 2 * np.pi
+    x = np.linspace(-1, 1, num_of_points - 1)
+    point_sets = {
+        'random': random.rand(num_of_points, 2) * 1000,
+        'circle': np.column_stack([np.cos(angles), np.sin(angles)]) * 1000,
+        # A parabola and a point far below it
+        'parabola': np.vstack([np.column_stack([x, x ** 2]), [(0, -100)]]) * 1000,
+    }
+
+    result = {'points': num_of_points}
+    for name, points in point_sets.items():
+        tuples = [tuple(point) for point in points]
+        start_time = time.time()
+        for _ in xrange(CONVEX_HULL_REPEATS):
+            legacy_hull = legacy_convex_hull(tuples)
+        legacy_time = (time.time() - start_time) / CONVEX_HULL_REPEATS
+
+        start_time = time.time()
+        for _ in xrange(CONVEX_HULL_REPEATS):
+            hull = calculateConvexHull(points)
+        hull_time = (time.time() - start_time) / CONVEX_HULL_REPEATS
+
+        assert np.array_equal(hull, legacy_hull)
+        result[name] = {'hull_size': len(hull), 'legacy_ms': 1000 * legacy_time, 'numpy_ms': 1000 * hull_time}
+    return result
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the video rendering pipeline.')
+    parser.add_argument('--frames', type=int, default=200, help='number of frames rendered per scene')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='also measure the throughput of a pool of that many worker processes')
+    parser.add_argument('--scene', action='append', choices=['cube'] + sorted(ROOM_IMAGES),
+                        help='scene to benchmark, can be repeated. All scenes by default')
+    parser.add_argument('--hull-points', type=int, default=2000,
+                        help='number of points of the convex hull benchmark, 0 to skip it')
+    parser.add_argument('--output', help='file to write the JSON results to. Standard output by default')
+    args = parser.parse_args()
+
+    scenes = {'cube': build_cube_scene}
+    for name, (image_name, image_width) in ROOM_IMAGES.items():
+        scenes[name] = lambda stages, image_name=image_name, image_width=image_width: \
+            build_room_scene(stages, image_name, image_width)
+
+    results = {
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'timestamp': time.time(),
+        'frames': args.frames,
+        'workers': args.workers,
+        'scenes': {},
+    }
+    # The pipeline logs its progress to standard output, keep it for the results
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    try:
+        for name in args.scene or sorted(scenes):
+            result = benchmark_scene(name, scenes[name], args.frames, args.workers)
+            results['scenes'][name] = result
+            print '%-10s %7.1f fps  p50 %6.1f ms  p99 %6.1f ms  peak RSS %6.0f MB' % (
+                name, result['fps'], result['frame_latency_ms']['p50'], result['frame_latency_ms']['p99'],
+                result['peak_rss_mb'])
+    finally:
+        sys.stdout = stdout
+
+    if args.hull_points > 0:
+        results['convex_hull'] = benchmark_convex_hull(args.hull_points)
+        for name in ('random', 'circle', 'parabola'):
+            print >> sys.stderr, 'hull %-8s %6d points  legacy %8.2f ms  numpy %8.2f ms' % (
+                name, args.hull_points, results['convex_hull'][name]['legacy_ms'],
+                results['convex_hull'][name]['numpy_ms'])
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        json.dump(results, output, indent=2, sort_keys=True)
+        output.write('\n')
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()